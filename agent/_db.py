@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, Sequence
+
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import scoped_session
+
+from db.session import SessionLocal, init_db
+
+Session = scoped_session(SessionLocal)
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def ensure_db() -> None:
+    """
+    Runs init_db() once per process instead of on every agent call.
+    Concurrent first callers wait for a single initialization.
+
+    Input: None
+    Output: None
+    """
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        init_db()
+        _initialized = True
+
+
+@contextmanager
+def session_scope(session=None) -> Iterator:
+    """
+    Yields a database session for a unit of work.
+    A caller-provided session is used as-is and the caller owns its commit.
+    Calls nested inside another scope on the same thread join that scope's
+    transaction. Otherwise the thread-local session is committed on success,
+    rolled back on error and released on exit.
+
+    Input: session=None
+    Output: <Session object>
+    """
+    if session is not None:
+        yield session
+        return
+    if Session.registry.has():
+        yield Session()
+        return
+    ensure_db()
+    local = Session()
+    try:
+        yield local
+        local.commit()
+    except Exception:
+        local.rollback()
+        raise
+    finally:
+        Session.remove()
+
+
+def upsert(
+    session,
+    model,
+    values: dict[str, Any],
+    conflict_columns: Sequence[str],
+    update_values: dict[str, Any],
+) -> None:
+    """
+    Inserts a row or updates the existing one in a single statement using the
+    dialect's native upsert. conflict_columns must match a unique constraint.
+
+    Input: session=<Session>, model=TaskQueue, values={...}, conflict_columns=("user_id", "email_id"), update_values={...}
+    Output: None
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql_insert(model).values(**values).on_duplicate_key_update(**update_values)
+    elif dialect in {"sqlite", "postgresql"}:
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        stmt = insert(model).values(**values).on_conflict_do_update(
+            index_elements=list(conflict_columns),
+            set_=update_values,
+        )
+    else:
+        raise NotImplementedError(f"upsert is not supported for dialect {dialect!r}")
+    session.execute(stmt)
+
+
+def upsert_many(
+    session,
+    model,
+    rows: Sequence[dict[str, Any]],
+    conflict_columns: Sequence[str],
+    update_columns: Sequence[str],
+) -> None:
+    """
+    Inserts many rows in one multi-row statement, updating update_columns of
+    rows that already exist from the incoming values. All rows must share the
+    same keys, and conflict_columns must match a unique constraint.
+
+    Input: session=<Session>, model=EmailMemory, rows=[{...}, ...], conflict_columns=("user_id", "email_id"), update_columns=("subject",)
+    Output: None
+    """
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql_insert(model).values(list(rows))
+        stmt = stmt.on_duplicate_key_update(**{column: stmt.inserted[column] for column in update_columns})
+    elif dialect in {"sqlite", "postgresql"}:
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        stmt = insert(model).values(list(rows))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(conflict_columns),
+            set_={column: stmt.excluded[column] for column in update_columns},
+        )
+    else:
+        raise NotImplementedError(f"upsert is not supported for dialect {dialect!r}")
+    session.execute(stmt)
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except Exception:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def json_loads(text: str | bytes) -> Any:
+    """
+    Parses JSON with orjson when available, falling back to the stdlib parser
+    for input orjson rejects (e.g. NaN literals).
+
+    Input: text='{"Intent": "Proposal"}'
+    Output: {"Intent": "Proposal"}
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+def json_dumps(value: Any) -> str:
+    """
+    Serializes a value to compact JSON, using orjson when available.
+
+    Input: value={"Intent": "Proposal"}
+    Output: '{"Intent":"Proposal"}'
+    """
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=True, separators=(",", ":"))
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_listener: QueueListener | None = None
+
+
+def configure_logging() -> None:
+    """
+    Sets up root logging at LOG_LEVEL. Records are handed to a queue and
+    written by a background listener thread, so worker threads never block
+    on the stream.
+
+    Input: None
+    Output: None
+    """
+    global _listener
+    if _listener is not None:
+        return
+    root = logging.getLogger()
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root.addHandler(QueueHandler(records))
+    _listener = QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import os
+import re
+
+_EMAIL_CONTEXT_MAX_CHARS = max(200, int(os.getenv("EMAIL_CONTEXT_MAX_CHARS", "2000")))
+# Signature delimiter ("-- "), an "On ... wrote:" attribution line, or the first quoted line.
+_TAIL_RE = re.compile(r"\n-{2,}[ \t]*\n|\nOn [^\n]+? wrote:[ \t]*\n|\n>+ ?")
+_HSPACE_RE = re.compile(r"[^\S\n]+")
+_BLANK_LINES_RE = re.compile(r" ?\n(?: ?\n)+ ?")
+
+
+def trim_email(body: str, max_chars: int | None = None) -> str:
+    """
+    Shortens an email body for LLM prompts by dropping the signature and quoted
+    reply chain, collapsing runs of whitespace and capping the length.
+    A body that is nothing but quoted text is kept rather than emptied.
+
+    Input: body="Can we meet Friday?\n\nOn Mon, Bob wrote:\n> Hi", max_chars=2000
+    Output: "Can we meet Friday?"
+    """
+    if not body:
+        return ""
+    limit = _EMAIL_CONTEXT_MAX_CHARS if max_chars is None else max_chars
+    text = body.replace("\r\n", "\n")
+    head = _TAIL_RE.split(text, maxsplit=1)[0]
+    if head.strip():
+        text = head
+    text = _HSPACE_RE.sub(" ", text)
+    text = _BLANK_LINES_RE.sub("\n\n", text).strip()
+    return text[:limit]
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+_last_now: tuple[int, str] = (-1, "")
+# Plain epoch values such as "1700000000" or "1700000000000.5".
+_NUMERIC_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def now_iso() -> str:
+    """
+    Returns the current UTC time in ISO format at second resolution.
+    The formatted string is reused for every call within the same second.
+
+    Input: None
+    Output: "2023-11-14T15:00:00+00:00"
+    """
+    global _last_now
+    second = int(time.time())
+    cached_second, cached_iso = _last_now
+    if cached_second == second:
+        return cached_iso
+    iso = datetime.fromtimestamp(second, tz=timezone.utc).isoformat()
+    _last_now = (second, iso)
+    return iso
+
+
+def now_ms() -> int:
+    """
+    Returns the current UTC time as integer epoch milliseconds.
+
+    Input: None
+    Output: 1699974000000
+    """
+    return time.time_ns() // 1_000_000
+
+
+def iso_from_ms(epoch_ms: int | None) -> str:
+    """
+    Formats epoch milliseconds as a UTC ISO string for display.
+    Unset values (0 or None) format as an empty string.
+
+    Input: epoch_ms=1699974000000
+    Output: "2023-11-14T15:00:00+00:00"
+    """
+    if not epoch_ms:
+        return ""
+    return datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc).isoformat()
+
+
+def _from_epoch(value: float) -> tuple[str, datetime]:
+    """
+    Converts epoch seconds or milliseconds to an aware UTC datetime.
+
+    Input: value=1700000000000
+    Output: ("2023-11-14T22:13:20+00:00", datetime(...))
+    """
+    if value > 10**12:
+        value = value / 1000.0
+    dt = datetime.fromtimestamp(value, tz=timezone.utc)
+    return dt.isoformat(), dt
+
+
+def normalize_timestamp(value: Any) -> tuple[str, datetime | None]:
+    """
+    Normalizes an epoch number or ISO string to an ISO string plus its datetime.
+    Numeric strings are recognised up front so the common Gmail internalDate
+    case never goes through a failing fromisoformat() call. Unparseable
+    strings are returned unchanged with no datetime.
+
+    Input: value="1700000000000"
+    Output: ("2023-11-14T22:13:20+00:00", datetime(...))
+    """
+    if value is None or value == "":
+        return "", None
+    if isinstance(value, (int, float)):
+        return _from_epoch(float(value))
+    if isinstance(value, str):
+        # Eight digits is also a valid basic ISO date (YYYYMMDD).
+        if _NUMERIC_RE.fullmatch(value) and not (len(value) == 8 and value.isdigit()):
+            try:
+                return _from_epoch(float(value))
+            except (OverflowError, OSError, ValueError):
+                return value, None
+        try:
+            dt = datetime.fromisoformat(value)
+            return dt.isoformat(), dt
+        except ValueError:
+            try:
+                return _from_epoch(float(value))
+            except Exception:
+                return value, None
+    return str(value), None
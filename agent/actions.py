@@ -1,26 +1,36 @@
 from __future__ import annotations
 
-import json
-from datetime import datetime, timezone
-from typing import Any
-
-from agent.behavior import compute_behavior_profile, sender_domain_from_observed
-from agent.decision import generate_reply_with_status
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+import numpy as np
+from sqlalchemy import case
+
+from agent._jsonutils import json_dumps
+from agent.behavior import compute_behavior_profile, compute_behavior_profiles, sender_domain_from_observed
+from agent.decision import generate_replies_batch, generate_reply_with_status
 from agent.persist import store_action_state
-from gmail.drafts import create_gmail_draft
+from gmail.drafts import create_gmail_draft, create_gmail_drafts_batch
 from google_calendar.events import create_calendar_event
+from agent._db import session_scope, upsert
+from agent._timeutils import now_ms as _now_ms
 from db.models import EmailMemory, TaskQueue
-from db.session import get_session, init_db
-
-ALLOWED_ACTIONS = {
-    "ignore",
-    "draft_reply",
-    "create_task",
-    "flag_high_urgency",
-    "escalate_human_review",
-    "schedule_meeting",
-}
-_DRAFT_MIN_FINAL_SCORE = 0.55
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_ACTIONS = frozenset(
+    {
+        "ignore",
+        "draft_reply",
+        "create_task",
+        "flag_high_urgency",
+        "escalate_human_review",
+        "schedule_meeting",
+    }
+)
 _DRAFT_AUTO_THRESHOLD = 0.65
 _REVIEW_TASK_THRESHOLD = 0.60
 _REVIEW_THRESHOLD = 0.45
@@ -28,6 +38,35 @@ _MAX_BEHAVIOR_INFLUENCE = 0.40
 _FULL_BEHAVIOR_AT_SAMPLES = 25
 _LOW_SAMPLE_INVARIANT_LIMIT = 8
 _CLEAR_IGNORE_CONFIDENCE = 0.90
+_SKIP_DRAFT_OVERRIDE_RATE = 0.70
+
+# Adaptive routing ladder per proposed action: (min final score, requires RequiresAction, routed action).
+# The first matching rule wins; otherwise the fallback (or the proposed action itself) is kept.
+_ROUTING_RULES = {
+    "draft_reply": (
+        (_DRAFT_AUTO_THRESHOLD, False, "draft_reply"),
+        (_REVIEW_TASK_THRESHOLD, True, "create_task"),
+        (_REVIEW_THRESHOLD, False, "escalate_human_review"),
+    ),
+    "ignore": (
+        (_REVIEW_TASK_THRESHOLD, True, "create_task"),
+        (_REVIEW_THRESHOLD, False, "escalate_human_review"),
+    ),
+}
+_ROUTING_FALLBACK = {"draft_reply": "escalate_human_review"}
+# Actions whose handler generates a reply draft.
+_DRAFTING_ACTIONS = frozenset({"draft_reply", "schedule_meeting"})
+# Analysis fields read by execute_next_action, fetched in one map(analysis.get, ...) pass.
+_ANALYSIS_FIELDS = (
+    "NextAction",
+    "RequiresReply",
+    "RequiresAction",
+    "Confidence",
+    "Intent",
+    "ActionReason",
+    "Reasoning",
+    "MeetingDetails",
+)
 
 
 def _safe_action(value: Any, requires_reply: Any) -> str:
@@ -37,6 +76,9 @@ def _safe_action(value: Any, requires_reply: Any) -> str:
     Input: value="draft_reply", requires_reply=True
     Output: "draft_reply"
     """
+    # Fast path: the LLM output is usually already canonical.
+    if type(value) is str and value in ALLOWED_ACTIONS:
+        return value
     if isinstance(value, str):
         action = value.strip().lower()
         if action in ALLOWED_ACTIONS:
@@ -55,23 +97,65 @@ def _safe_confidence(value: Any) -> float:
     Input: value="0.95"
     Output: 0.95
     """
+    kind = type(value)
+    if kind is float:
+        if value != value:  # NaN
+            return 0.0
+        return 0.0 if value < 0.0 else (1.0 if value > 1.0 else value)
+    if kind is int:
+        return 0.0 if value < 0 else (1.0 if value > 1 else float(value))
     try:
-        return max(0.0, min(1.0, float(value)))
+        number = float(value)
     except Exception:
         return 0.0
+    if math.isnan(number):
+        return 0.0
+    return max(0.0, min(1.0, number))
+
+
+def _route_action(proposed_action: str, final_score: float, requires_action: bool) -> str:
+    """
+    Applies the adaptive routing ladder for the proposed action in a single pass.
+
+    Input: proposed_action="draft_reply", final_score=0.62, requires_action=True
+    Output: "create_task"
+    """
+    rules = _ROUTING_RULES.get(proposed_action)
+    if rules is None:
+        return proposed_action
+    for threshold, needs_action, action in rules:
+        if final_score >= threshold and (requires_action or not needs_action):
+            return action
+    return _ROUTING_FALLBACK.get(proposed_action, proposed_action)
 
 
-def _enqueue_task(observed: dict[str, Any], reason: str, user_id: int = None) -> None:
+def _dump_draft(draft: dict[str, Any]) -> str:
+    """
+    Serializes a draft payload for persistence as compact JSON, using orjson
+    when available.
+
+    Input: draft={"DraftReply": "Hi", "Reasoning": "...", "Confidence": 0.9}
+    Output: '{"DraftReply":"Hi","Reasoning":"...","Confidence":0.9}'
+    """
+    return json_dumps(draft)
+
+
+def _enqueue_task(
+    observed: dict[str, Any],
+    reason: str,
+    user_id: int = None,
+    session=None,
+    *,
+    now_ms: int | None = None,
+) -> None:
     """
     Enqueues a task in the database based on the observed email and reason.
 
     Input: observed={"email_id": "123", "subject": "Test"}, reason="Follow up", user_id=1
     Output: None
     """
-    init_db()
-    session = get_session()
-    now = datetime.now(tz=timezone.utc).isoformat()
-    try:
+    now = now_ms or _now_ms()
+    with session_scope(session) as session:
         email_id = observed.get("email_id") or observed.get("id") or ""
         if not email_id:
             return
@@ -81,85 +165,171 @@ def _enqueue_task(observed: dict[str, Any], reason: str, user_id: int = None) ->
         if body:
             description = f"{description}\n\nEmail excerpt:\n{body[:1500]}"
 
-        query = session.query(TaskQueue).filter_by(email_id=email_id)
-        if user_id:
-            query = query.filter_by(user_id=user_id)
-        row = query.first()
-        if row:
-            row.title = title
-            row.description = description
-            if not row.status:
-                row.status = "open"
-            row.updated_at = now
-            session.add(row)
-        else:
-            session.add(
-                TaskQueue(
-                    email_id=email_id,
-                    user_id=user_id,
-                    title=title,
-                    description=description,
-                    status="open",
-                    created_at=now,
-                    updated_at=now,
-                )
-            )
-        session.commit()
-    finally:
-        session.close()
+        upsert(
+            session,
+            TaskQueue,
+            {
+                "email_id": email_id,
+                "user_id": user_id,
+                "title": title,
+                "description": description,
+                "status": "open",
+                "created_at": now,
+                "updated_at": now,
+            },
+            ("user_id", "email_id"),
+            {
+                "title": title,
+                "description": description,
+                "status": case((TaskQueue.status == "", "open"), else_=TaskQueue.status),
+                "updated_at": now,
+            },
+        )
 
 
 from email.utils import parseaddr
 
 
-def _has_existing_reply_draft(observed: dict[str, Any]) -> bool:
+def _has_existing_reply_draft(observed: dict[str, Any], user_id: int = None, session=None) -> bool:
     """
     Returns True if a reply draft is already persisted for this email id.
     """
-    init_db()
-    session = get_session()
-    try:
+    with session_scope(session) as session:
         email_id = observed.get("email_id") or observed.get("id") or ""
         if not email_id:
             return False
-        row = session.query(EmailMemory).filter_by(email_id=email_id).first()
-        return bool(row and str(row.reply_draft or "").strip())
-    finally:
-        session.close()
+        query = session.query(EmailMemory.reply_draft).filter_by(email_id=email_id)
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+        reply_draft = query.limit(1).scalar()
+        return bool(str(reply_draft or "").strip())
+
+class _Deferred:
+    """
+    Work an execute_next_actions run postpones until every email's action
+    is done: Gmail drafts for one batch request and database writes for its
+    final transaction.
+    """
+
+    def __init__(self):
+        self.writes: list[Callable[..., Any]] = []
+        self.drafts: list[tuple[dict[str, Any], str]] = []
 
-def execute_next_action(observed: dict[str, Any], analysis: dict[str, Any], service: Any = None, cal_service: Any = None, user_id: int = None) -> tuple[dict[str, Any], bool, str]:
+
+def _write(deferred: _Deferred | None, func: Callable[..., Any], *args, **kwargs) -> None:
+    """
+    Runs a database write now, or queues it on deferred; a queued write is
+    later called with the batch's session.
+
+    Input: deferred=None, func=store_action_state, *args/**kwargs of func
+    Output: None
+    """
+    if deferred is None:
+        func(*args, **kwargs)
+    else:
+        deferred.writes.append(partial(func, *args, **kwargs))
+
+
+def execute_next_action(
+    observed: dict[str, Any],
+    analysis: dict[str, Any],
+    service: Any = None,
+    cal_service: Any = None,
+    user_id: int = None,
+    *,
+    behavior: dict[str, Any] | None = None,
+    scores: tuple[float, float] | None = None,
+    session=None,
+    now_ms: int | None = None,
+    deferred: _Deferred | None = None,
+    reply: tuple[dict[str, Any], bool] | None = None,
+) -> tuple[dict[str, Any], bool, str]:
     """
     Executes the next action based on the analysis of the observed email.
+    Batch callers may supply a precomputed behavior profile, precomputed
+    (behavior_weight, final_score) scores, a shared session, a _Deferred
+    that collects the database writes instead of running them, and an
+    already generated (draft, ok) reply.
 
     Input: observed={...}, analysis={"NextAction": "draft_reply", ...}, user_id=1
     Output: ({"Action": "draft_reply", ...}, True, "")
     """
-    # ... (existing code) ...
-    
+    result = _decide_action(observed, analysis, behavior, scores)
+    return _run_handler(
+        observed,
+        analysis,
+        result,
+        service=service,
+        cal_service=cal_service,
+        user_id=user_id,
+        session=session,
+        now_ms=now_ms,
+        deferred=deferred,
+        reply=reply,
+    )
+
+
+def _run_handler(observed: dict[str, Any], analysis: dict[str, Any], result: dict[str, Any], **context) -> tuple[dict[str, Any], bool, str]:
+    """
+    Completes a routed action result with the handler of its action.
+
+    Input: observed={...}, analysis={...}, result={"Action": "ignore", ...}, **context=handler keywords
+    Output: ({"Action": "ignore", ...}, True, "")
+    """
+    handler = _HANDLERS.get(result["Action"])
+    if handler is None:
+        return result, False, "unsupported action"
+    return handler(observed, analysis, result, result["ActionReason"], **context)
+
+
+def _decide_action(
+    observed: dict[str, Any],
+    analysis: dict[str, Any],
+    behavior: dict[str, Any] | None,
+    scores: tuple[float, float] | None,
+) -> dict[str, Any]:
+    """
+    Routes the analyzed email to its next action and builds the action result
+    the handler completes.
 
+    Input: observed={...}, analysis={"NextAction": "draft_reply", ...}, behavior=None, scores=None
+    Output: {"Action": "draft_reply", "ActionReason": "...", ...}
+    """
     # PRIORITIZATION: If valid meeting details are extracted, force schedule_meeting
     # This overrides "ignore" or "escalate" from the LLM if it found a meeting but classified it poorly.
-    meeting_details = analysis.get("MeetingDetails") or {}
+    (
+        raw_next_action,
+        requires_reply,
+        raw_requires_action,
+        raw_confidence,
+        intent,
+        raw_action_reason,
+        reasoning,
+        meeting_details,
+    ) = map(analysis.get, _ANALYSIS_FIELDS)
+    meeting_details = meeting_details or {}
     if (
         meeting_details.get("StartTime") 
         and meeting_details.get("Summary")
     ):
-        analysis["NextAction"] = "schedule_meeting"
+        raw_next_action = analysis["NextAction"] = "schedule_meeting"
         # We also ensure the analysis dict reflects this for downstream logic
     
-    proposed_action = _safe_action(analysis.get("NextAction"), analysis.get("RequiresReply"))
-    llm_confidence = _safe_confidence(analysis.get("Confidence", 0.0))
-    behavior = compute_behavior_profile(
-        str(analysis.get("Intent") or ""),
-        sender_domain_from_observed(observed),
-    )
+    proposed_action = _safe_action(raw_next_action, requires_reply)
+    llm_confidence = _safe_confidence(raw_confidence)
+    requires_action = raw_requires_action is True
+    if behavior is None:
+        behavior = compute_behavior_profile(
+            str(intent or ""),
+            sender_domain_from_observed(observed),
+        )
     sample_size = int(behavior.get("sample_size", 0) or 0)
     importance_score = _safe_confidence(behavior.get("importance_score", 0.0))
-    behavior_weight = min(_MAX_BEHAVIOR_INFLUENCE, _MAX_BEHAVIOR_INFLUENCE * (sample_size / _FULL_BEHAVIOR_AT_SAMPLES))
-    final_score = ((1.0 - behavior_weight) * llm_confidence) + (behavior_weight * importance_score)
-
-    next_action = proposed_action
-    requires_action = analysis.get("RequiresAction") is True
+    if scores is None:
+        behavior_weight = min(_MAX_BEHAVIOR_INFLUENCE, _MAX_BEHAVIOR_INFLUENCE * (sample_size / _FULL_BEHAVIOR_AT_SAMPLES))
+        final_score = ((1.0 - behavior_weight) * llm_confidence) + (behavior_weight * importance_score)
+    else:
+        behavior_weight, final_score = scores
 
     # Stability invariant: clear ignore with high LLM confidence should survive cold start.
     if (
@@ -168,28 +338,23 @@ def execute_next_action(observed: dict[str, Any], analysis: dict[str, Any], serv
         and sample_size < _LOW_SAMPLE_INVARIANT_LIMIT
     ):
         next_action = "ignore"
-    
-    if proposed_action == "draft_reply":
-        if final_score >= _DRAFT_AUTO_THRESHOLD:
-            next_action = "draft_reply"
-        elif final_score >= _REVIEW_TASK_THRESHOLD and requires_action:
-            next_action = "create_task"
-        elif final_score >= _REVIEW_THRESHOLD:
-            next_action = "escalate_human_review"
-        elif final_score < _DRAFT_MIN_FINAL_SCORE:
-            next_action = "escalate_human_review"
-    elif proposed_action == "ignore":
-        if (
-            llm_confidence >= _CLEAR_IGNORE_CONFIDENCE
-            and sample_size < _LOW_SAMPLE_INVARIANT_LIMIT
-        ):
-            next_action = "ignore"
-        elif final_score >= _REVIEW_TASK_THRESHOLD and requires_action:
-            next_action = "create_task"
-        elif final_score >= _REVIEW_THRESHOLD:
-            next_action = "escalate_human_review"
-
-    action_reason = str(analysis.get("ActionReason") or analysis.get("Reasoning") or "").strip()
+    else:
+        next_action = _route_action(proposed_action, final_score, requires_action)
+
+    # With enough history showing this intent's (or sender's) drafts are usually
+    # overridden, a generated draft would likely be discarded: queue a task and
+    # skip the LLM call.
+    draft_llm_skipped = (
+        next_action == "draft_reply"
+        and sample_size >= _FULL_BEHAVIOR_AT_SAMPLES
+        and _safe_confidence(
+            behavior.get("scoped_override_rate", behavior.get("manual_override_rate", 0.0))
+        ) > _SKIP_DRAFT_OVERRIDE_RATE
+    )
+    if draft_llm_skipped:
+        next_action = "create_task"
+
+    action_reason = str(raw_action_reason or reasoning or "").strip()
     result = {
         "ProposedAction": proposed_action,
         "Action": next_action,
@@ -205,102 +370,371 @@ def execute_next_action(observed: dict[str, Any], analysis: dict[str, Any], serv
         "FinalDecisionScore": final_score,
         "Draft": {"DraftReply": "", "Reasoning": "No draft generated for this action.", "Confidence": 1.0},
     }
-    if proposed_action != next_action:
+    if draft_llm_skipped:
+        result["ActionReason"] = f"{action_reason} (LLM skipped: historical override rate high)".strip()
+    elif proposed_action != next_action:
         result["ActionReason"] = (
             f"{action_reason} Adaptive routing changed action from {proposed_action} "
             f"to {next_action} because unified final score was {final_score:.2f} "
             f"(behavior weight {behavior_weight:.2f}, samples {sample_size})."
         ).strip()
-    persisted_reason = result["ActionReason"]
-
-    if next_action == "ignore":
-        store_action_state(observed, next_action, persisted_reason, task_status="", urgent_flag=False, needs_human_review=False)
-        return result, True, ""
-
-    if next_action == "draft_reply":
-        draft, draft_ok = generate_reply_with_status(observed, analysis)
-        if not draft_ok:
-            return result, False, str(draft.get("Reasoning", "draft unavailable"))
-        draft_already_exists = _has_existing_reply_draft(observed)
-        draft_json = json.dumps(draft, ensure_ascii=True)
-        store_action_state(
+    return result
+
+
+def _handle_ignore(
+    observed: dict[str, Any],
+    analysis: dict[str, Any],
+    result: dict[str, Any],
+    reason: str,
+    *,
+    service: Any,
+    cal_service: Any,
+    user_id: int,
+    session,
+    now_ms: int | None,
+    deferred: _Deferred | None,
+    reply: tuple[dict[str, Any], bool] | None,
+) -> tuple[dict[str, Any], bool, str]:
+    """
+    Records an ignore decision without side effects.
+
+    Input: observed={...}, analysis={...}, result={"Action": "ignore", ...}, reason="..."
+    Output: ({"Action": "ignore", ...}, True, "")
+    """
+    _write(deferred, store_action_state, observed, "ignore", reason, task_status="", urgent_flag=False, needs_human_review=False, user_id=user_id, session=session, now_ms=now_ms)
+    return result, True, ""
+
+
+def _handle_draft_reply(
+    observed: dict[str, Any],
+    analysis: dict[str, Any],
+    result: dict[str, Any],
+    reason: str,
+    *,
+    service: Any,
+    cal_service: Any,
+    user_id: int,
+    session,
+    now_ms: int | None,
+    deferred: _Deferred | None,
+    reply: tuple[dict[str, Any], bool] | None,
+) -> tuple[dict[str, Any], bool, str]:
+    """
+    Generates a reply draft, stores it and mirrors it to Gmail.
+
+    Input: observed={...}, analysis={...}, result={"Action": "draft_reply", ...}, reason="..."
+    Output: ({"Action": "draft_reply", ...}, True, "")
+    """
+    draft, draft_ok = reply or generate_reply_with_status(observed, analysis)
+    if not draft_ok:
+        return result, False, str(draft.get("Reasoning", "draft unavailable"))
+    draft_already_exists = _has_existing_reply_draft(observed, user_id=user_id, session=session)
+    draft_json = _dump_draft(draft)
+    # The Gmail call runs in a worker while the database write stays on
+    # this thread, which owns the session.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        gmail_future = None
+        if service and not draft_already_exists:
+            if deferred is not None:
+                deferred.drafts.append((observed, draft.get("DraftReply", "")))
+            else:
+                gmail_future = pool.submit(create_gmail_draft, service, observed, draft.get("DraftReply", ""))
+        _write(
+            deferred,
+            store_action_state,
             observed,
-            next_action,
-            persisted_reason,
+            "draft_reply",
+            reason,
             task_status="",
             urgent_flag=False,
             needs_human_review=False,
             reply_json=draft_json,
+            user_id=user_id,
+            session=session,
+            now_ms=now_ms,
         )
-        if service and not draft_already_exists:
-            create_gmail_draft(service, observed, draft.get("DraftReply", ""))
-        
-        result["Draft"] = draft
-        return result, True, ""
-
-    if next_action == "create_task":
-        _enqueue_task(observed, persisted_reason, user_id=user_id)
-        store_action_state(observed, next_action, persisted_reason, task_status="open")
-        return result, True, ""
-
-    if next_action == "flag_high_urgency":
-        store_action_state(observed, next_action, persisted_reason, urgent_flag=True)
-        return result, True, ""
-
-    if next_action == "escalate_human_review":
-        store_action_state(observed, next_action, persisted_reason, needs_human_review=True)
-        return result, True, ""
-
-    if next_action == "schedule_meeting":
-        details = analysis.get("MeetingDetails") or {}
-        sender = observed.get("from", "Unknown Sender")
-        
-        # Parse clean email for attendees
-        _, sender_email = parseaddr(sender)
-
-        agenda = details.get("Agenda") or "No agenda provided."
-        
-        description_lines = [
-            f"{persisted_reason}",
-            "",
-            f"Sender: {sender}",
-            f"Agenda: {agenda}",
-            "",
-            f"Link: {details.get('Link', 'N/A')}",
-            f"Platform: {details.get('Platform', 'N/A')}",
-        ]
-        
-        event_details = {
-            "summary": details.get("Summary") or observed.get("subject") or "Meeting",
-            "description": "\n".join(description_lines),
-            "start_time": details.get("StartTime"),
-            "location": details.get("Platform", ""),
-            "attendees": [sender_email] if sender_email else []
-        }
+        if gmail_future is not None:
+            gmail_future.result()
+
+    result["Draft"] = draft
+    return result, True, ""
+
+
+def _handle_create_task(
+    observed: dict[str, Any],
+    analysis: dict[str, Any],
+    result: dict[str, Any],
+    reason: str,
+    *,
+    service: Any,
+    cal_service: Any,
+    user_id: int,
+    session,
+    now_ms: int | None,
+    deferred: _Deferred | None,
+    reply: tuple[dict[str, Any], bool] | None,
+) -> tuple[dict[str, Any], bool, str]:
+    """
+    Enqueues a follow-up task for the email.
+
+    Input: observed={...}, analysis={...}, result={"Action": "create_task", ...}, reason="..."
+    Output: ({"Action": "create_task", ...}, True, "")
+    """
+    _write(deferred, _enqueue_task, observed, reason, user_id=user_id, session=session, now_ms=now_ms)
+    _write(deferred, store_action_state, observed, "create_task", reason, task_status="open", user_id=user_id, session=session, now_ms=now_ms)
+    return result, True, ""
+
+
+def _handle_flag_high_urgency(
+    observed: dict[str, Any],
+    analysis: dict[str, Any],
+    result: dict[str, Any],
+    reason: str,
+    *,
+    service: Any,
+    cal_service: Any,
+    user_id: int,
+    session,
+    now_ms: int | None,
+    deferred: _Deferred | None,
+    reply: tuple[dict[str, Any], bool] | None,
+) -> tuple[dict[str, Any], bool, str]:
+    """
+    Flags the email as urgent.
+
+    Input: observed={...}, analysis={...}, result={"Action": "flag_high_urgency", ...}, reason="..."
+    Output: ({"Action": "flag_high_urgency", ...}, True, "")
+    """
+    _write(deferred, store_action_state, observed, "flag_high_urgency", reason, urgent_flag=True, user_id=user_id, session=session, now_ms=now_ms)
+    return result, True, ""
+
+
+def _handle_escalate_human_review(
+    observed: dict[str, Any],
+    analysis: dict[str, Any],
+    result: dict[str, Any],
+    reason: str,
+    *,
+    service: Any,
+    cal_service: Any,
+    user_id: int,
+    session,
+    now_ms: int | None,
+    deferred: _Deferred | None,
+    reply: tuple[dict[str, Any], bool] | None,
+) -> tuple[dict[str, Any], bool, str]:
+    """
+    Marks the email for human review.
+
+    Input: observed={...}, analysis={...}, result={"Action": "escalate_human_review", ...}, reason="..."
+    Output: ({"Action": "escalate_human_review", ...}, True, "")
+    """
+    _write(deferred, store_action_state, observed, "escalate_human_review", reason, needs_human_review=True, user_id=user_id, session=session, now_ms=now_ms)
+    return result, True, ""
+
+
+def _handle_schedule_meeting(
+    observed: dict[str, Any],
+    analysis: dict[str, Any],
+    result: dict[str, Any],
+    reason: str,
+    *,
+    service: Any,
+    cal_service: Any,
+    user_id: int,
+    session,
+    now_ms: int | None,
+    deferred: _Deferred | None,
+    reply: tuple[dict[str, Any], bool] | None,
+) -> tuple[dict[str, Any], bool, str]:
+    """
+    Creates the calendar event and an acceptance draft for a meeting request.
+
+    Input: observed={...}, analysis={...}, result={"Action": "schedule_meeting", ...}, reason="..."
+    Output: ({"Action": "schedule_meeting", ...}, True, "")
+    """
+    details = analysis.get("MeetingDetails") or {}
+    sender = observed.get("from", "Unknown Sender")
+
+    # Parse clean email for attendees
+    _, sender_email = parseaddr(sender)
+
+    agenda = details.get("Agenda") or "No agenda provided."
+
+    description_lines = [
+        f"{reason}",
+        "",
+        f"Sender: {sender}",
+        f"Agenda: {agenda}",
+        "",
+        f"Link: {details.get('Link', 'N/A')}",
+        f"Platform: {details.get('Platform', 'N/A')}",
+    ]
+
+    event_details = {
+        "summary": details.get("Summary") or observed.get("subject") or "Meeting",
+        "description": "\n".join(description_lines),
+        "start_time": details.get("StartTime"),
+        "location": details.get("Platform", ""),
+        "attendees": [sender_email] if sender_email else []
+    }
+    # The calendar event and the acceptance draft are independent network
+    # calls, so they run concurrently. Database work stays on this thread.
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        draft_future = None if reply else pool.submit(generate_reply_with_status, observed, analysis)
+        calendar_future = None
         if cal_service and event_details["start_time"]:
-            created = create_calendar_event(cal_service, event_details)
-            if created:
-                result["CalendarEvent"] = f"Created ID: {created.get('id')}"
-            else:
-                result["CalendarEvent"] = "Failed to create event. Check logs."
-        
-        # Generate and store a draft reply accepting the meeting
-        draft, draft_ok = generate_reply_with_status(observed, analysis)
+            calendar_future = pool.submit(create_calendar_event, cal_service, event_details)
+
+        draft, draft_ok = reply or draft_future.result()
         draft_json = None
+        gmail_future = None
         if draft_ok:
-            draft_already_exists = _has_existing_reply_draft(observed)
-            draft_json = json.dumps(draft, ensure_ascii=True)
+            draft_already_exists = _has_existing_reply_draft(observed, user_id=user_id, session=session)
+            draft_json = _dump_draft(draft)
             if service and not draft_already_exists:
-                create_gmail_draft(service, observed, draft.get("DraftReply", ""))
+                if deferred is not None:
+                    deferred.drafts.append((observed, draft.get("DraftReply", "")))
+                else:
+                    gmail_future = pool.submit(create_gmail_draft, service, observed, draft.get("DraftReply", ""))
             result["Draft"] = draft
 
-        store_action_state(
-            observed, 
-            next_action, 
-            persisted_reason,
-            task_status="scheduled",
-            reply_json=draft_json
+        if calendar_future is not None:
+            created = calendar_future.result()
+            if created:
+                result["CalendarEvent"] = f"Created ID: {created.get('id')}"
+            else:
+                result["CalendarEvent"] = "Failed to create event. Check logs."
+        if gmail_future is not None:
+            gmail_future.result()
+
+    _write(
+        deferred,
+        store_action_state,
+        observed,
+        "schedule_meeting",
+        reason,
+        task_status="scheduled",
+        reply_json=draft_json,
+        user_id=user_id,
+        session=session,
+        now_ms=now_ms,
+    )
+    return result, True, ""
+
+
+# Action -> handler; every handler shares the keyword-only context signature.
+_HANDLERS = {
+    "ignore": _handle_ignore,
+    "draft_reply": _handle_draft_reply,
+    "create_task": _handle_create_task,
+    "flag_high_urgency": _handle_flag_high_urgency,
+    "escalate_human_review": _handle_escalate_human_review,
+    "schedule_meeting": _handle_schedule_meeting,
+}
+
+
+def execute_next_actions(
+    observed_list: list[dict[str, Any]],
+    analysis_list: list[dict[str, Any]],
+    service: Any = None,
+    cal_service: Any = None,
+    user_id: int = None,
+) -> list[tuple[dict[str, Any], bool, str]]:
+    """
+    Executes the next action for a batch of emails.
+    Behavior profiles are aggregated once in a short session and the replies
+    of drafting actions are generated concurrently. The actions' network
+    calls run with no transaction open; the Gmail drafts and database
+    writes of every email whose action completed are sent as one batch
+    request and committed together at the end.
+    An email whose action raises is reported as failed without affecting
+    the others.
+
+    Input: observed_list=[{...}, {...}], analysis_list=[{"NextAction": "ignore", ...}, {...}], user_id=1
+    Output: [({"Action": "ignore", ...}, True, ""), ...]
+    """
+    if len(observed_list) != len(analysis_list):
+        raise ValueError("observed_list and analysis_list must have the same length")
+    if not observed_list:
+        return []
+
+    keys = [
+        (str(analysis.get("Intent") or ""), sender_domain_from_observed(observed))
+        for observed, analysis in zip(observed_list, analysis_list)
+    ]
+    batch_now = _now_ms()
+    with session_scope() as session:
+        profiles = compute_behavior_profiles(keys, session=session)
+    behaviors = [profiles[key] for key in keys]
+    weights, final_scores = _batch_scores(
+        [_safe_confidence(analysis.get("Confidence", 0.0)) for analysis in analysis_list],
+        [_safe_confidence(behavior.get("importance_score", 0.0)) for behavior in behaviors],
+        [int(behavior.get("sample_size", 0) or 0) for behavior in behaviors],
+    )
+
+    results = [
+        _decide_action(observed, analysis, behavior, (float(weight), float(final_score)))
+        for observed, analysis, behavior, weight, final_score in zip(
+            observed_list, analysis_list, behaviors, weights, final_scores
         )
-        return result, True, ""
+    ]
+    # Replies for every drafting action are generated up front with concurrent LLM calls.
+    drafting = [i for i, result in enumerate(results) if result["Action"] in _DRAFTING_ACTIONS]
+    replies = dict(zip(drafting, generate_replies_batch(
+        [(observed_list[i], analysis_list[i]) for i in drafting]
+    )))
+
+    outcomes = []
+    batch = _Deferred()
+    for i, (observed, analysis, result) in enumerate(zip(observed_list, analysis_list, results)):
+        # Writes are collected per email and only kept once its action finished.
+        deferred = _Deferred()
+        try:
+            outcome = _run_handler(
+                observed,
+                analysis,
+                result,
+                service=service,
+                cal_service=cal_service,
+                user_id=user_id,
+                session=None,
+                now_ms=batch_now,
+                deferred=deferred,
+                reply=replies.get(i),
+            )
+        except Exception as exc:
+            logger.error("Action for email %s failed: %s", observed.get("email_id") or observed.get("id"), exc)
+            outcome = ({"Action": "", "ActionReason": ""}, False, f"action failed: {exc.__class__.__name__}")
+        else:
+            batch.writes.extend(deferred.writes)
+            batch.drafts.extend(deferred.drafts)
+        outcomes.append(outcome)
+
+    if batch.drafts:
+        try:
+            create_gmail_drafts_batch(service, batch.drafts)
+        except Exception as exc:
+            logger.error("Creating Gmail drafts failed: %s", exc)
+    if batch.writes:
+        with session_scope() as session:
+            for write in batch.writes:
+                write(session=session)
+    return outcomes
+
+
+def _batch_scores(
+    confidences: list[float], importances: list[float], sample_sizes: list[int]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized form of the per-email behavior weight and unified final score.
 
-    return result, False, "unsupported action"
+    Input: confidences=[0.9, 0.4], importances=[0.5, 0.8], sample_sizes=[25, 0]
+    Output: (array([0.4, 0.0]), array([0.74, 0.4]))
+    """
+    samples = np.asarray(sample_sizes, dtype=np.float64)
+    weights = np.minimum(_MAX_BEHAVIOR_INFLUENCE, _MAX_BEHAVIOR_INFLUENCE * (samples / _FULL_BEHAVIOR_AT_SAMPLES))
+    final_scores = (1.0 - weights) * np.asarray(confidences, dtype=np.float64) + weights * np.asarray(
+        importances, dtype=np.float64
+    )
+    return weights, final_scores
@@ -1,23 +1,85 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import os
+import threading
+import time
 from email.utils import parseaddr
-from typing import Any
-
-from db.models import BehaviorLog
-from db.session import get_session, init_db
+from functools import lru_cache
+from typing import Any, Iterable
+
+from sqlalchemy import and_, case, delete, event, func, insert, or_, select
+
+from agent._db import session_scope, upsert
+from agent._timeutils import now_ms as _now_ms
+from db.session import SessionLocal
+from db.models import BehaviorAggGlobal, BehaviorAggIntent, BehaviorAggSender, BehaviorLog
+
+FINAL_ACTIONS = frozenset({"sent_reply", "ignored", "edited_draft", "deleted"})
+_REPLY_FINALS = frozenset({"sent_reply", "edited_draft"})
+# User final actions that count as "agreeing" with each agent action.
+_EXPECTED_FINALS = {
+    "draft_reply": _REPLY_FINALS,
+    "ignore": frozenset({"ignored", "deleted"}),
+    "create_task": _REPLY_FINALS,
+    "flag_high_urgency": _REPLY_FINALS | {"ignored"},
+    "escalate_human_review": _REPLY_FINALS | {"ignored"},
+}
+_BEHAVIOR_CACHE_TTL_SECONDS = max(1, int(os.getenv("BEHAVIOR_CACHE_TTL_SECONDS", "60")))
+# Bumped after every committed BehaviorLog write so cached profiles are never served stale in-process.
+_profile_epoch = 0
+
+# Rolling aggregate tables: model -> (key column, counter columns).
+_AGG_LAYOUT = {
+    BehaviorAggSender: ("sender_domain", ("total", "replies", "opens", "auto_total", "overrides")),
+    BehaviorAggIntent: ("intent", ("total", "replies", "auto_total", "overrides")),
+    BehaviorAggGlobal: ("id", ("auto_total", "overrides")),
+}
+_GLOBAL_AGG_ID = 1
+# Finalized rows an intent or sender needs before its own override rate is
+# trusted over the global one.
+_SCOPED_OVERRIDE_MIN_SAMPLES = 10
+# BehaviorLog columns that feed the rolling aggregates, in _aggregate_contributions order.
+_AGG_SOURCE_COLUMNS = (
+    BehaviorLog.intent,
+    BehaviorLog.sender_domain,
+    BehaviorLog.user_final_action,
+    BehaviorLog.user_opened,
+    BehaviorLog.agent_action,
+)
+_aggregates_ready = False
+_aggregates_lock = threading.Lock()
+# Rows fetched per round trip when rebuilding the aggregates from BehaviorLog.
+_REBUILD_BATCH_SIZE = 5000
+
+
+def _invalidate_behavior_profiles() -> None:
+    """
+    Invalidates cached behavior profiles after a BehaviorLog write.
 
-FINAL_ACTIONS = {"sent_reply", "ignored", "edited_draft", "deleted"}
+    Input: None
+    Output: None
+    """
+    global _profile_epoch
+    _profile_epoch += 1
 
 
-def _now_iso() -> str:
+def _invalidate_behavior_profiles_on_commit(session) -> None:
     """
-    Returns the current UTC time in ISO format.
+    Invalidates cached behavior profiles once the session's transaction commits,
+    so no profile computed from the uncommitted rows is cached under the new epoch.
 
-    Input: None
-    Output: "2023-11-14T15:00:00+00:00"
+    Input: session=<Session>
+    Output: None
     """
-    return datetime.now(tz=timezone.utc).isoformat()
+    if session.info.get("behavior_invalidate_pending"):
+        return
+    session.info["behavior_invalidate_pending"] = True
+
+    def _after_commit(committed):
+        committed.info.pop("behavior_invalidate_pending", None)
+        _invalidate_behavior_profiles()
+
+    event.listen(session, "after_commit", _after_commit, once=True)
 
 
 def sender_domain_from_observed(observed: dict[str, Any]) -> str:
@@ -27,7 +89,17 @@ def sender_domain_from_observed(observed: dict[str, Any]) -> str:
     Input: observed={"from": "user@example.com"}
     Output: "example.com"
     """
-    sender = str(observed.get("from") or observed.get("sender") or "")
+    return _parse_sender_domain(str(observed.get("from") or observed.get("sender") or ""))
+
+
+@lru_cache(maxsize=4096)
+def _parse_sender_domain(sender: str) -> str:
+    """
+    Parses the lowercase domain out of a From header; memoized since senders repeat within a batch.
+
+    Input: sender="User <user@Example.com>"
+    Output: "example.com"
+    """
     _, addr = parseaddr(sender)
     if "@" not in addr:
         return ""
@@ -48,6 +120,8 @@ def log_behavior_event(
     user_final_action: str = "",
     user_opened: bool | None = None,
     user_id: int = None,
+    session=None,
+    now_ms: int | None = None,
 ) -> None:
     """
     Logs a behavior event to the database.
@@ -57,60 +131,81 @@ def log_behavior_event(
     """
     if not email_id:
         return
-    init_db()
-    session = get_session()
-    now = _now_iso()
-    try:
-        query = session.query(BehaviorLog).filter_by(email_id=email_id)
-        if user_id:
-            query = query.filter_by(user_id=user_id)
-        row = query.first()
-        clean_final = user_final_action.strip().lower()
-        if clean_final not in FINAL_ACTIONS:
-            clean_final = ""
-
-        if row:
-            row.intent = (intent or "").strip()
-            row.sender_domain = (sender_domain or "").strip().lower()
-            row.requires_reply = bool(requires_reply) if isinstance(requires_reply, bool) else False
-            row.proposed_action = (proposed_action or "").strip().lower()
-            row.agent_action = (agent_action or "").strip().lower()
-            if user_opened is not None:
-                row.user_opened = bool(user_opened)
-            row.llm_confidence = max(0.0, min(1.0, float(llm_confidence or 0.0)))
-            row.behavior_match_score = max(0.0, min(1.0, float(behavior_match_score or 0.0)))
-            row.final_decision_score = max(0.0, min(1.0, float(final_decision_score or 0.0)))
-            if clean_final:
-                row.user_final_action = clean_final
-            row.updated_at = now
-            session.add(row)
-            session.commit()
-            return
-
-        session.add(
-            BehaviorLog(
-                email_id=email_id,
-                user_id=user_id,
-                intent=(intent or "").strip(),
-                sender_domain=(sender_domain or "").strip().lower(),
-                requires_reply=bool(requires_reply) if isinstance(requires_reply, bool) else False,
-                user_final_action=clean_final,
-                user_opened=bool(user_opened) if user_opened is not None else False,
-                proposed_action=(proposed_action or "").strip().lower(),
-                agent_action=(agent_action or "").strip().lower(),
-                llm_confidence=max(0.0, min(1.0, float(llm_confidence or 0.0))),
-                behavior_match_score=max(0.0, min(1.0, float(behavior_match_score or 0.0))),
-                final_decision_score=max(0.0, min(1.0, float(final_decision_score or 0.0))),
-                created_at=now,
-                updated_at=now,
-            )
+    now = now_ms or _now_ms()
+    clean_final = user_final_action.strip().lower()
+    if clean_final not in FINAL_ACTIONS:
+        clean_final = ""
+    fields = {
+        "intent": (intent or "").strip(),
+        "sender_domain": (sender_domain or "").strip().lower(),
+        "requires_reply": bool(requires_reply) if isinstance(requires_reply, bool) else False,
+        "proposed_action": (proposed_action or "").strip().lower(),
+        "agent_action": (agent_action or "").strip().lower(),
+        "llm_confidence": max(0.0, min(1.0, float(llm_confidence or 0.0))),
+        "behavior_match_score": max(0.0, min(1.0, float(behavior_match_score or 0.0))),
+        "final_decision_score": max(0.0, min(1.0, float(final_decision_score or 0.0))),
+        "updated_at": now,
+    }
+    # On conflict, keep the previously recorded user signals unless new ones were given.
+    update_fields = dict(fields)
+    if user_opened is not None:
+        update_fields["user_opened"] = bool(user_opened)
+    if clean_final:
+        update_fields["user_final_action"] = clean_final
+
+    with session_scope(session) as session:
+        _ensure_behavior_aggregates()
+        previous = (
+            session.query(*_AGG_SOURCE_COLUMNS)
+            .filter_by(user_id=user_id, email_id=email_id)
+            .first()
         )
-        session.commit()
-    finally:
-        session.close()
+        upsert(
+            session,
+            BehaviorLog,
+            {
+                **fields,
+                "email_id": email_id,
+                "user_id": user_id,
+                "user_final_action": clean_final,
+                "user_opened": bool(user_opened) if user_opened is not None else False,
+                "created_at": now,
+            },
+            ("user_id", "email_id"),
+            update_fields,
+        )
+        if previous:
+            final_after = clean_final or previous.user_final_action
+            opened_after = bool(user_opened) if user_opened is not None else previous.user_opened
+        else:
+            final_after = clean_final
+            opened_after = bool(user_opened) if user_opened is not None else False
+        _apply_aggregate_delta(
+            session,
+            _aggregate_contributions(*previous) if previous else {},
+            _aggregate_contributions(
+                fields["intent"], fields["sender_domain"], final_after, opened_after, fields["agent_action"]
+            ),
+        )
+        _invalidate_behavior_profiles_on_commit(session)
 
 
-def record_user_final_action(email_id: str, user_final_action: str) -> bool:
+def log_behavior_events(events: list[dict[str, Any]]) -> None:
+    """
+    Logs several behavior events in one transaction, so a cycle's events cost
+    a single commit instead of one each.
+
+    Input: events=[{"email_id": "123", "intent": "proposal", ...}, ...]
+    Output: None
+    """
+    if not events:
+        return
+    with session_scope() as session:
+        for fields in events:
+            log_behavior_event(**fields, session=session)
+
+
+def record_user_final_action(email_id: str, user_final_action: str, session=None) -> bool:
     """
     Records the user's final action for a specific email.
 
@@ -120,23 +215,26 @@ def record_user_final_action(email_id: str, user_final_action: str) -> bool:
     clean = (user_final_action or "").strip().lower()
     if clean not in FINAL_ACTIONS:
         return False
-    init_db()
-    session = get_session()
-    try:
-        row = session.query(BehaviorLog).filter_by(email_id=email_id).first()
-        if not row:
+    with session_scope(session) as session:
+        _ensure_behavior_aggregates()
+        previous = session.query(*_AGG_SOURCE_COLUMNS).filter_by(email_id=email_id).all()
+        if not previous:
             return False
-        row.user_final_action = clean
-        row.user_opened = True
-        row.updated_at = _now_iso()
-        session.add(row)
-        session.commit()
-        return True
-    finally:
-        session.close()
+        session.query(BehaviorLog).filter_by(email_id=email_id).update(
+            {"user_final_action": clean, "user_opened": True, "updated_at": _now_ms()},
+            synchronize_session=False,
+        )
+        for row in previous:
+            _apply_aggregate_delta(
+                session,
+                _aggregate_contributions(*row),
+                _aggregate_contributions(row.intent, row.sender_domain, clean, True, row.agent_action),
+            )
+        _invalidate_behavior_profiles_on_commit(session)
+    return True
 
 
-def record_user_opened(email_id: str) -> bool:
+def record_user_opened(email_id: str, session=None) -> bool:
     """
     Records that the user opened the email.
 
@@ -145,19 +243,23 @@ def record_user_opened(email_id: str) -> bool:
     """
     if not email_id:
         return False
-    init_db()
-    session = get_session()
-    try:
-        row = session.query(BehaviorLog).filter_by(email_id=email_id).first()
-        if not row:
+    with session_scope(session) as session:
+        _ensure_behavior_aggregates()
+        previous = session.query(*_AGG_SOURCE_COLUMNS).filter_by(email_id=email_id).all()
+        if not previous:
             return False
-        row.user_opened = True
-        row.updated_at = _now_iso()
-        session.add(row)
-        session.commit()
-        return True
-    finally:
-        session.close()
+        session.query(BehaviorLog).filter_by(email_id=email_id).update(
+            {"user_opened": True, "updated_at": _now_ms()},
+            synchronize_session=False,
+        )
+        for row in previous:
+            _apply_aggregate_delta(
+                session,
+                _aggregate_contributions(*row),
+                _aggregate_contributions(row.intent, row.sender_domain, row.user_final_action, True, row.agent_action),
+            )
+        _invalidate_behavior_profiles_on_commit(session)
+    return True
 
 
 def _is_reply_action(user_final_action: str) -> bool:
@@ -168,7 +270,7 @@ def _is_reply_action(user_final_action: str) -> bool:
     Output: True
     """
     clean = (user_final_action or "").strip().lower()
-    return clean in {"sent_reply", "edited_draft"}
+    return clean in _REPLY_FINALS
 
 
 def _is_manual_override(agent_action: str, user_final_action: str) -> bool:
@@ -180,14 +282,7 @@ def _is_manual_override(agent_action: str, user_final_action: str) -> bool:
     """
     action = (agent_action or "").strip().lower()
     final = (user_final_action or "").strip().lower()
-    expected = {
-        "draft_reply": {"sent_reply", "edited_draft"},
-        "ignore": {"ignored", "deleted"},
-        "create_task": {"edited_draft", "sent_reply"},
-        "flag_high_urgency": {"sent_reply", "edited_draft", "ignored"},
-        "escalate_human_review": {"edited_draft", "sent_reply", "ignored"},
-    }
-    allowed = expected.get(action)
+    allowed = _EXPECTED_FINALS.get(action)
     if not allowed:
         return False
     return final not in allowed
@@ -208,84 +303,375 @@ def _safe_rate(numerator: float, denominator: float, default: float = 0.0) -> fl
 def compute_behavior_profile(intent: str, sender_domain: str) -> dict[str, float | int]:
     """
     Computes the behavior profile based on intent and sender domain history.
+    Results are cached per (intent, sender_domain) for a short TTL and
+    invalidated on any BehaviorLog write from this process.
 
     Input: intent="proposal", sender_domain="example.com"
     Output: {"reply_rate_by_sender": 0.5, ...}
     """
-    init_db()
-    session = get_session()
-    try:
-        rows = session.query(BehaviorLog).all()
-        clean_intent = (intent or "").strip().lower()
-        clean_domain = (sender_domain or "").strip().lower()
-
-        sender_total = 0
-        sender_replies = 0
-        intent_total = 0
-        intent_replies = 0
-        open_total = 0
-        open_opened = 0
-        auto_total = 0
-        overrides = 0
-
-        for row in rows:
-            row_intent = (row.intent or "").strip().lower()
-            row_domain = (row.sender_domain or "").strip().lower()
-            row_final = (row.user_final_action or "").strip().lower()
-
-            if row_domain == clean_domain and clean_domain:
-                sender_total += 1
-                if row_final in FINAL_ACTIONS and _is_reply_action(row_final):
-                    sender_replies += 1
-
-            if row_intent == clean_intent and clean_intent:
-                intent_total += 1
-                if row_final in FINAL_ACTIONS and _is_reply_action(row_final):
-                    intent_replies += 1
-
-            if row_domain == clean_domain and clean_domain:
-                open_total += 1
-                if bool(getattr(row, "user_opened", False)):
-                    open_opened += 1
-
-            if row_final not in FINAL_ACTIONS:
-                continue
-            auto_total += 1
-            if _is_manual_override(row.agent_action, row_final):
-                overrides += 1
-
-        sample_size = max(sender_total, intent_total, auto_total)
-        if sample_size <= 0:
-            return {
-                "reply_rate_by_sender": 0.0,
-                "reply_rate_by_intent": 0.0,
-                "open_rate": 0.0,
-                "manual_override_rate": 0.0,
-                "importance_score": 0.0,
-                "sample_size": 0,
-            }
-
-        reply_rate_by_sender = _safe_rate(sender_replies, sender_total, default=0.0)
-        reply_rate_by_intent = _safe_rate(intent_replies, intent_total, default=0.0)
-        open_rate = _safe_rate(open_opened, open_total, default=0.0)
-        manual_override_rate = _safe_rate(overrides, auto_total, default=0.0)
-
-        # Unified behavior importance: reply-history dominant, open-rate minor.
-        importance_score = (
-            (0.60 * reply_rate_by_sender)
-            + (0.30 * reply_rate_by_intent)
-            + (0.05 * open_rate)
-            + (0.05 * (1.0 - manual_override_rate))
-        )
+    clean_intent = (intent or "").strip().lower()
+    clean_domain = (sender_domain or "").strip().lower()
+    ttl_bucket = int(time.time() // _BEHAVIOR_CACHE_TTL_SECONDS)
+    return dict(_cached_behavior_profile(clean_intent, clean_domain, _profile_epoch, ttl_bucket))
+
+
+@lru_cache(maxsize=2048)
+def _cached_behavior_profile(
+    clean_intent: str, clean_domain: str, epoch: int, ttl_bucket: int
+) -> tuple[tuple[str, float | int], ...]:
+    """
+    Memoized profile lookup; epoch and ttl_bucket only participate in the cache key.
+
+    Input: clean_intent="proposal", clean_domain="example.com", epoch=0, ttl_bucket=28394
+    Output: (("reply_rate_by_sender", 0.5), ...)
+    """
+    return tuple(_query_behavior_profile(clean_intent, clean_domain).items())
+
+
+def _count(condition):
+    """
+    Builds a NULL-safe conditional COUNT aggregate for the given SQL condition.
+
+    Input: condition=BehaviorLog.user_opened.is_(True)
+    Output: <SQL expression>
+    """
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _is_final_clause():
+    """
+    SQL condition: the row carries a recognised user final action.
+
+    Input: None
+    Output: <SQL expression>
+    """
+    return BehaviorLog.user_final_action.in_(sorted(FINAL_ACTIONS))
+
+
+def _is_reply_clause():
+    """
+    SQL condition: the user's final action was a reply.
+
+    Input: None
+    Output: <SQL expression>
+    """
+    return BehaviorLog.user_final_action.in_(sorted(_REPLY_FINALS))
+
+
+def _is_override_clause():
+    """
+    SQL condition mirroring _is_manual_override for rows with a final action.
+
+    Input: None
+    Output: <SQL expression>
+    """
+    return and_(
+        _is_final_clause(),
+        or_(
+            *(
+                and_(BehaviorLog.agent_action == action, BehaviorLog.user_final_action.notin_(sorted(allowed)))
+                for action, allowed in _EXPECTED_FINALS.items()
+            )
+        ),
+    )
+
+
+def _profile_from_counters(
+    sender_total: int,
+    sender_replies: int,
+    intent_total: int,
+    intent_replies: int,
+    open_opened: int,
+    auto_total: int,
+    overrides: int,
+    scoped_finals: tuple[tuple[int, int], ...] = (),
+) -> dict[str, float | int]:
+    """
+    Turns raw BehaviorLog counters into the behavior profile dictionary.
+    scoped_override_rate is the override rate of the first (auto_total,
+    overrides) pair in scoped_finals with enough history, else the global one.
 
+    Input: sender_total=2, sender_replies=1, intent_total=2, intent_replies=1, open_opened=1, auto_total=3, overrides=1, scoped_finals=((2, 1), (1, 0))
+    Output: {"reply_rate_by_sender": 0.5, ...}
+    """
+    open_total = sender_total
+    sample_size = max(sender_total, intent_total, auto_total)
+    if sample_size <= 0:
         return {
-            "reply_rate_by_sender": max(0.0, min(1.0, reply_rate_by_sender)),
-            "reply_rate_by_intent": max(0.0, min(1.0, reply_rate_by_intent)),
-            "open_rate": max(0.0, min(1.0, open_rate)),
-            "manual_override_rate": max(0.0, min(1.0, manual_override_rate)),
-            "importance_score": max(0.0, min(1.0, importance_score)),
-            "sample_size": int(sample_size),
+            "reply_rate_by_sender": 0.0,
+            "reply_rate_by_intent": 0.0,
+            "open_rate": 0.0,
+            "manual_override_rate": 0.0,
+            "scoped_override_rate": 0.0,
+            "importance_score": 0.0,
+            "sample_size": 0,
         }
-    finally:
-        session.close()
 
+    reply_rate_by_sender = _safe_rate(sender_replies, sender_total, default=0.0)
+    reply_rate_by_intent = _safe_rate(intent_replies, intent_total, default=0.0)
+    open_rate = _safe_rate(open_opened, open_total, default=0.0)
+    manual_override_rate = _safe_rate(overrides, auto_total, default=0.0)
+    scoped_override_rate = next(
+        (
+            _safe_rate(scoped_overrides, scoped_total, default=0.0)
+            for scoped_total, scoped_overrides in scoped_finals
+            if scoped_total >= _SCOPED_OVERRIDE_MIN_SAMPLES
+        ),
+        manual_override_rate,
+    )
+
+    # Unified behavior importance: reply-history dominant, open-rate minor.
+    importance_score = (
+        (0.60 * reply_rate_by_sender)
+        + (0.30 * reply_rate_by_intent)
+        + (0.05 * open_rate)
+        + (0.05 * (1.0 - manual_override_rate))
+    )
+
+    return {
+        "reply_rate_by_sender": max(0.0, min(1.0, reply_rate_by_sender)),
+        "reply_rate_by_intent": max(0.0, min(1.0, reply_rate_by_intent)),
+        "open_rate": max(0.0, min(1.0, open_rate)),
+        "manual_override_rate": max(0.0, min(1.0, manual_override_rate)),
+        "scoped_override_rate": max(0.0, min(1.0, scoped_override_rate)),
+        "importance_score": max(0.0, min(1.0, importance_score)),
+        "sample_size": int(sample_size),
+    }
+
+
+def _query_behavior_profile(clean_intent: str, clean_domain: str) -> dict[str, float | int]:
+    """
+    Computes the behavior profile for already-normalized keys.
+
+    Input: clean_intent="proposal", clean_domain="example.com"
+    Output: {"reply_rate_by_sender": 0.5, ...}
+    """
+    return compute_behavior_profiles([(clean_intent, clean_domain)])[(clean_intent, clean_domain)]
+
+
+def compute_behavior_profiles(
+    pairs: Iterable[tuple[str, str]],
+    session=None,
+) -> dict[tuple[str, str], dict[str, float | int]]:
+    """
+    Computes behavior profiles for many (intent, sender_domain) pairs at once.
+    Reads the rolling aggregate tables, so the cost is independent of BehaviorLog size.
+
+    Input: pairs=[("proposal", "example.com"), ("invoice", "acme.io")]
+    Output: {("proposal", "example.com"): {"reply_rate_by_sender": 0.5, ...}, ...}
+    """
+    keys = {
+        (intent, sender_domain): ((intent or "").strip().lower(), (sender_domain or "").strip().lower())
+        for intent, sender_domain in pairs
+    }
+    if not keys:
+        return {}
+
+    domains = sorted({domain for _, domain in keys.values() if domain})
+    intents = sorted({intent for intent, _ in keys.values() if intent})
+
+    with session_scope(session) as session:
+        _ensure_behavior_aggregates()
+        by_domain: dict[str, tuple[int, ...]] = {}
+        if domains:
+            rows = (
+                session.query(
+                    BehaviorAggSender.sender_domain,
+                    BehaviorAggSender.total,
+                    BehaviorAggSender.replies,
+                    BehaviorAggSender.opens,
+                    BehaviorAggSender.auto_total,
+                    BehaviorAggSender.overrides,
+                )
+                .filter(BehaviorAggSender.sender_domain.in_(domains))
+                .all()
+            )
+            by_domain = {row[0]: tuple(int(value or 0) for value in row[1:]) for row in rows}
+
+        by_intent: dict[str, tuple[int, ...]] = {}
+        if intents:
+            rows = (
+                session.query(
+                    BehaviorAggIntent.intent,
+                    BehaviorAggIntent.total,
+                    BehaviorAggIntent.replies,
+                    BehaviorAggIntent.auto_total,
+                    BehaviorAggIntent.overrides,
+                )
+                .filter(BehaviorAggIntent.intent.in_(intents))
+                .all()
+            )
+            by_intent = {row[0]: tuple(int(value or 0) for value in row[1:]) for row in rows}
+
+        overall = (
+            session.query(BehaviorAggGlobal.auto_total, BehaviorAggGlobal.overrides)
+            .filter_by(id=_GLOBAL_AGG_ID)
+            .first()
+        )
+        auto_total, overrides = (int(value or 0) for value in overall) if overall else (0, 0)
+
+    profiles = {}
+    for key, (clean_intent, clean_domain) in keys.items():
+        sender_total, sender_replies, open_opened, *sender_finals = by_domain.get(clean_domain, (0, 0, 0, 0, 0))
+        intent_total, intent_replies, *intent_finals = by_intent.get(clean_intent, (0, 0, 0, 0))
+        profiles[key] = _profile_from_counters(
+            sender_total,
+            sender_replies,
+            intent_total,
+            intent_replies,
+            open_opened,
+            auto_total,
+            overrides,
+            # The intent's own history first, then the sender's, then global.
+            (tuple(intent_finals), tuple(sender_finals)),
+        )
+    return profiles
+
+
+def _aggregate_contributions(
+    intent: str,
+    sender_domain: str,
+    user_final_action: str,
+    user_opened: bool,
+    agent_action: str,
+) -> dict[tuple[Any, str | int], tuple[int, ...]]:
+    """
+    Returns what a single BehaviorLog row adds to each rolling aggregate row.
+
+    Input: intent="Proposal", sender_domain="example.com", user_final_action="sent_reply", user_opened=True, agent_action="draft_reply"
+    Output: {(BehaviorAggSender, "example.com"): (1, 1, 1, 1, 0), (BehaviorAggIntent, "proposal"): (1, 1, 1, 0), (BehaviorAggGlobal, 1): (1, 0)}
+    """
+    clean_domain = (sender_domain or "").strip().lower()
+    clean_intent = (intent or "").strip().lower()
+    final = (user_final_action or "").strip().lower()
+    is_final = final in FINAL_ACTIONS
+    is_reply = is_final and _is_reply_action(final)
+    finals = (int(is_final), int(is_final and _is_manual_override(agent_action, final)))
+
+    contributions: dict[tuple[Any, str | int], tuple[int, ...]] = {}
+    if clean_domain:
+        contributions[(BehaviorAggSender, clean_domain)] = (1, int(is_reply), int(bool(user_opened)), *finals)
+    if clean_intent:
+        contributions[(BehaviorAggIntent, clean_intent)] = (1, int(is_reply), *finals)
+    contributions[(BehaviorAggGlobal, _GLOBAL_AGG_ID)] = finals
+    return contributions
+
+
+def _apply_aggregate_delta(session, before: dict, after: dict) -> None:
+    """
+    Moves the rolling aggregates from a row's old contributions to its new ones
+    with atomic UPDATE-with-arithmetic upserts.
+
+    Input: session=<Session>, before={...}, after={...}
+    Output: None
+    """
+    for model, key in set(before) | set(after):
+        key_column, columns = _AGG_LAYOUT[model]
+        old = before.get((model, key)) or (0,) * len(columns)
+        new = after.get((model, key)) or (0,) * len(columns)
+        deltas = {column: n - o for column, o, n in zip(columns, old, new) if n != o}
+        if not deltas:
+            continue
+        upsert(
+            session,
+            model,
+            {key_column: key, **{column: deltas.get(column, 0) for column in columns}},
+            (key_column,),
+            {column: getattr(model, column) + delta for column, delta in deltas.items()},
+        )
+
+
+def _ensure_behavior_aggregates() -> None:
+    """
+    Backfills the rolling aggregate tables from BehaviorLog the first time they are used.
+    The global row doubles as the "aggregates initialized" marker.
+    The backfill runs under a lock in its own committed transaction, so it
+    happens once however many threads get here first, and a rollback of the
+    caller's transaction cannot undo it.
+
+    Input: None
+    Output: None
+    """
+    global _aggregates_ready
+    if _aggregates_ready:
+        return
+    with _aggregates_lock:
+        if _aggregates_ready:
+            return
+        with SessionLocal() as backfill, backfill.begin():
+            if backfill.query(BehaviorAggGlobal.id).filter_by(id=_GLOBAL_AGG_ID).first() is None:
+                _rebuild_behavior_aggregates(backfill)
+        _aggregates_ready = True
+
+
+def _rebuild_behavior_aggregates(session) -> None:
+    """
+    Recomputes every rolling aggregate row from BehaviorLog.
+    Grouped rows are streamed as plain tuples and written with Core
+    executemany inserts, so no mapped instances are built on either side.
+
+    Input: session=<Session>
+    Output: None
+    """
+    is_reply = _is_reply_clause()
+    for model in (BehaviorAggSender, BehaviorAggIntent, BehaviorAggGlobal):
+        session.execute(delete(model))
+
+    is_final = _is_final_clause()
+    is_override = _is_override_clause()
+    sender_stmt = (
+        select(
+            BehaviorLog.sender_domain,
+            func.count(),
+            _count(is_reply),
+            _count(BehaviorLog.user_opened.is_(True)),
+            _count(is_final),
+            _count(is_override),
+        )
+        .where(BehaviorLog.sender_domain != "")
+        .group_by(BehaviorLog.sender_domain)
+    )
+    row_intent = func.lower(BehaviorLog.intent)
+    intent_stmt = (
+        select(row_intent, func.count(), _count(is_reply), _count(is_final), _count(is_override))
+        .where(BehaviorLog.intent != "")
+        .group_by(row_intent)
+    )
+    global_stmt = select(func.count(), _count(_is_override_clause())).where(_is_final_clause())
+
+    # Results are fully consumed before inserting: MySQL cannot run another
+    # statement on a connection while a streamed result is still open.
+    sender_params = [
+        {
+            "sender_domain": domain,
+            "total": int(total),
+            "replies": int(replies or 0),
+            "opens": int(opens or 0),
+            "auto_total": int(auto_total or 0),
+            "overrides": int(overrides or 0),
+        }
+        for domain, total, replies, opens, auto_total, overrides in session.execute(sender_stmt).yield_per(
+            _REBUILD_BATCH_SIZE
+        )
+    ]
+    intent_params = [
+        {
+            "intent": intent,
+            "total": int(total),
+            "replies": int(replies or 0),
+            "auto_total": int(auto_total or 0),
+            "overrides": int(overrides or 0),
+        }
+        for intent, total, replies, auto_total, overrides in session.execute(intent_stmt).yield_per(
+            _REBUILD_BATCH_SIZE
+        )
+    ]
+    auto_total, overrides = (int(value or 0) for value in session.execute(global_stmt).one())
+
+    if sender_params:
+        session.execute(insert(BehaviorAggSender), sender_params)
+    if intent_params:
+        session.execute(insert(BehaviorAggIntent), intent_params)
+    session.execute(
+        insert(BehaviorAggGlobal).values(id=_GLOBAL_AGG_ID, auto_total=auto_total, overrides=overrides)
+    )
@@ -1,8 +1,49 @@
-import json
-from typing import Any
-
+import copy
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Sequence
+
+from agent._jsonutils import json_dumps, json_loads
+from agent._textclean import trim_email
 from ai.llm import call_llm
 
+logger = logging.getLogger(__name__)
+
+_LLM_BATCH_CONCURRENCY = max(1, int(os.getenv("LLM_BATCH_CONCURRENCY", "4")))
+_DECISION_CACHE_SIZE = max(0, int(os.getenv("DECISION_CACHE_SIZE", "1024")))
+# Content hash -> successful LLM payload, least recently used first.
+_decision_cache: OrderedDict[str, dict[str, Any]] = OrderedDict()
+_decision_cache_lock = threading.Lock()
+
+_ALLOWED_ACTIONS = frozenset(
+    {
+        "ignore",
+        "draft_reply",
+        "create_task",
+        "flag_high_urgency",
+        "escalate_human_review",
+        "schedule_meeting",
+    }
+)
+_ACTION_ALIASES = {
+    "draft": "draft_reply",
+    "reply": "draft_reply",
+    "create task": "create_task",
+    "task": "create_task",
+    "flag high urgency": "flag_high_urgency",
+    "high_urgency": "flag_high_urgency",
+    "escalate": "escalate_human_review",
+    "human_review": "escalate_human_review",
+    "schedule meeting": "schedule_meeting",
+    "schedule": "schedule_meeting",
+    "meeting": "schedule_meeting",
+}
+_URGENCIES = frozenset({"low", "medium", "high"})
+
 
 EXEC_EMAIL_ANALYSIS_PROMPT = """
 You are an intelligent executive email assistant.
@@ -65,11 +106,14 @@ Do not include markdown or any extra keys.
 def _clean_json(raw: str) -> str:
     """
     Cleans raw JSON string by extracting the content between the first { and last }.
+    A response that is already a bare object is returned without scanning it.
 
     Input: "```json\n{\"key\": \"value\"}\n```"
     Output: "{\"key\": \"value\"}"
     """
     raw = raw.strip()
+    if raw[:1] == "{" and raw[-1:] == "}":
+        return raw
     # Find first { and last } regardless of markdown backticks or preamble
     start = raw.find("{")
     end = raw.rfind("}")
@@ -78,15 +122,74 @@ def _clean_json(raw: str) -> str:
     return raw
 
 
+def _prompt_version(prompt: str) -> bytes:
+    """
+    Returns a short digest of a prompt so cached results are dropped when it changes.
+
+    Input: prompt="You are..."
+    Output: b"\x12\x34..."
+    """
+    return hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest()
+
+
+_ANALYSIS_PROMPT_VERSION = _prompt_version(EXEC_EMAIL_ANALYSIS_PROMPT)
+_REPLY_PROMPT_VERSION = _prompt_version(EXEC_EMAIL_REPLY_PROMPT)
+
+
+def _cache_key(prompt_version: bytes, user_content: str) -> str:
+    """
+    Builds the decision cache key for a prompt and its user message.
+
+    Input: prompt_version=b"...", user_content="Hello"
+    Output: "3f2a..."
+    """
+    digest = hashlib.blake2b(prompt_version, digest_size=16)
+    digest.update(user_content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _cache_get(key: str) -> dict[str, Any] | None:
+    """
+    Returns a copy of a cached payload, or None on a miss.
+
+    Input: key="3f2a..."
+    Output: {"Intent": "Proposal", ...}
+    """
+    with _decision_cache_lock:
+        payload = _decision_cache.get(key)
+        if payload is None:
+            return None
+        _decision_cache.move_to_end(key)
+    return copy.deepcopy(payload)
+
+
+def _cache_put(key: str, payload: dict[str, Any]) -> None:
+    """
+    Stores a copy of a payload, evicting the least recently used entry when full.
+
+    Input: key="3f2a...", payload={"Intent": "Proposal", ...}
+    Output: None
+    """
+    if _DECISION_CACHE_SIZE <= 0:
+        return
+    stored = copy.deepcopy(payload)
+    with _decision_cache_lock:
+        _decision_cache[key] = stored
+        _decision_cache.move_to_end(key)
+        while len(_decision_cache) > _DECISION_CACHE_SIZE:
+            _decision_cache.popitem(last=False)
+
+
 def _email_content(email: Any) -> str:
     """
-    Extracts the content from an email object or dictionary.
+    Extracts the prompt content from an email object or dictionary, with the
+    signature and quoted reply chain trimmed off.
 
     Input: {"content": "Hello"}
     Output: "Hello"
     """
     if isinstance(email, dict):
-        return str(email.get("content", ""))
+        return trim_email(str(email.get("content", "")))
     return ""
 
 
@@ -134,31 +237,10 @@ def _normalize_next_action(value: Any, requires_reply: Any) -> str:
     Input: value="reply", requires_reply=True
     Output: "draft_reply"
     """
-    allowed = {
-        "ignore",
-        "draft_reply",
-        "create_task",
-        "flag_high_urgency",
-        "escalate_human_review",
-        "schedule_meeting",
-    }
     if isinstance(value, str):
         normalized = value.strip().lower()
-        aliases = {
-            "draft": "draft_reply",
-            "reply": "draft_reply",
-            "create task": "create_task",
-            "task": "create_task",
-            "flag high urgency": "flag_high_urgency",
-            "high_urgency": "flag_high_urgency",
-            "escalate": "escalate_human_review",
-            "human_review": "escalate_human_review",
-            "schedule meeting": "schedule_meeting",
-            "schedule": "schedule_meeting",
-            "meeting": "schedule_meeting",
-        }
-        normalized = aliases.get(normalized, normalized)
-        if normalized in allowed:
+        normalized = _ACTION_ALIASES.get(normalized, normalized)
+        if normalized in _ALLOWED_ACTIONS:
             return normalized
     if requires_reply is True:
         return "draft_reply"
@@ -177,12 +259,12 @@ def _coerce_analysis_payload(raw: str) -> tuple[dict[str, Any], bool]:
     parse_ok = True
     try:
         clean = _clean_json(raw)
-        parsed = json.loads(clean)
+        parsed = json_loads(clean)
         if not isinstance(parsed, dict):
             raise ValueError("response is not an object")
     except Exception as e:
-        print(f"DEBUG: JSON parse failure for analysis: {e}")
-        print(f"DEBUG: Raw response prefix: {raw[:200]}...")
+        logger.debug("JSON parse failure for analysis: %s", e)
+        logger.debug("Raw response prefix: %.200s...", raw)
         parsed = _fallback_analysis()
         parse_ok = False
 
@@ -201,7 +283,7 @@ def _coerce_analysis_payload(raw: str) -> tuple[dict[str, Any], bool]:
     if not payload["ActionReason"]:
         payload["ActionReason"] = payload["Reasoning"]
 
-    if payload["Urgency"] not in {"low", "medium", "high"}:
+    if payload["Urgency"] not in _URGENCIES:
         payload["Urgency"] = "low"
 
     try:
@@ -234,14 +316,27 @@ def _coerce_reply_payload(raw: str) -> dict[str, Any]:
     Input: raw='{"DraftReply": "Hi"}'
     Output: {"DraftReply": "Hi", ...}
     """
+    payload, _ = _coerce_reply_payload_with_status(raw)
+    return payload
+
+
+def _coerce_reply_payload_with_status(raw: str) -> tuple[dict[str, Any], bool]:
+    """
+    Coerces the raw LLM response into a reply payload and reports whether it parsed.
+
+    Input: raw='{"DraftReply": "Hi"}'
+    Output: ({"DraftReply": "Hi", ...}, True)
+    """
+    parse_ok = True
     try:
         clean = _clean_json(raw)
-        parsed = json.loads(clean)
+        parsed = json_loads(clean)
         if not isinstance(parsed, dict):
             raise ValueError("response is not an object")
     except Exception as e:
-        print(f"DEBUG: JSON parse failure for reply: {e}")
+        logger.debug("JSON parse failure for reply: %s", e)
         parsed = _fallback_reply()
+        parse_ok = False
 
     payload = {
         "DraftReply": str(parsed.get("DraftReply", "")).strip(),
@@ -255,7 +350,7 @@ def _coerce_reply_payload(raw: str) -> dict[str, Any]:
         payload["Confidence"] = 0.2
     payload["Confidence"] = max(0.0, min(1.0, payload["Confidence"]))
 
-    return payload
+    return payload, parse_ok
 
 
 def analyze_email(email: Any) -> dict[str, Any]:
@@ -276,15 +371,23 @@ def analyze_email_with_status(email: Any) -> tuple[dict[str, Any], bool]:
     Input: email={"content": "..."}
     Output: ({"Intent": "Proposal", ...}, True)
     """
+    content = _email_content(email)
+    key = _cache_key(_ANALYSIS_PROMPT_VERSION, content)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached, True
     try:
         raw = call_llm(
             EXEC_EMAIL_ANALYSIS_PROMPT,
-            _email_content(email),
+            content,
             temperature=0.1,
         )
     except Exception as exc:
         return _fallback_analysis(reasoning=f"analysis unavailable: {exc.__class__.__name__}"), False
-    return _coerce_analysis_payload(raw)
+    payload, parse_ok = _coerce_analysis_payload(raw)
+    if parse_ok:
+        _cache_put(key, payload)
+    return payload, parse_ok
 
 
 def generate_reply(email: Any, analysis: Any) -> dict[str, Any]:
@@ -310,15 +413,56 @@ def generate_reply_with_status(email: Any, analysis: Any) -> tuple[dict[str, Any
         "analysis": analysis if isinstance(analysis, dict) else _fallback_analysis(),
     }
 
+    user_content = json_dumps(user_payload)
+    key = _cache_key(_REPLY_PROMPT_VERSION, user_content)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached, True
     try:
         raw = call_llm(
             EXEC_EMAIL_REPLY_PROMPT,
-            json.dumps(user_payload, ensure_ascii=True),
+            user_content,
             temperature=0.2,
         )
     except Exception as exc:
         return _fallback_reply(reasoning=f"draft unavailable: {exc.__class__.__name__}"), False
-    return _coerce_reply_payload(raw), True
+    payload, parse_ok = _coerce_reply_payload_with_status(raw)
+    if parse_ok:
+        _cache_put(key, payload)
+    return payload, True
+
+
+def _run_concurrently(func: Callable[..., Any], calls: Sequence[tuple]) -> list[Any]:
+    """
+    Runs func once per argument tuple on a bounded thread pool, preserving order.
+
+    Input: func=analyze_email_with_status, calls=[(email1,), (email2,)]
+    Output: [result1, result2]
+    """
+    if len(calls) <= 1 or _LLM_BATCH_CONCURRENCY == 1:
+        return [func(*args) for args in calls]
+    with ThreadPoolExecutor(max_workers=min(_LLM_BATCH_CONCURRENCY, len(calls))) as pool:
+        return list(pool.map(lambda args: func(*args), calls))
+
+
+def analyze_emails_batch(emails: Sequence[Any]) -> list[tuple[dict[str, Any], bool]]:
+    """
+    Analyzes several emails with concurrent LLM requests.
+
+    Input: emails=[{"content": "..."}, {"content": "..."}]
+    Output: [({"Intent": "Proposal", ...}, True), ({"Intent": "Newsletter", ...}, True)]
+    """
+    return _run_concurrently(analyze_email_with_status, [(email,) for email in emails])
+
+
+def generate_replies_batch(pairs: Sequence[tuple[Any, Any]]) -> list[tuple[dict[str, Any], bool]]:
+    """
+    Generates reply drafts for several (email, analysis) pairs with concurrent LLM requests.
+
+    Input: pairs=[({"content": "..."}, {"NextAction": "draft_reply", ...})]
+    Output: [({"DraftReply": "..."}, True)]
+    """
+    return _run_concurrently(generate_reply_with_status, [(email, analysis) for email, analysis in pairs])
 
 
 def summarize(email: Any) -> str:
@@ -328,7 +472,7 @@ def summarize(email: Any) -> str:
     Input: email={...}
     Output: '{"Intent": "..."}'
     """
-    return json.dumps(analyze_email(email), ensure_ascii=True)
+    return json_dumps(analyze_email(email))
 
 
 def draft_reply(email: Any) -> str:
@@ -339,4 +483,4 @@ def draft_reply(email: Any) -> str:
     Output: '{"DraftReply": "..."}'
     """
     analysis = analyze_email(email)
-    return json.dumps(generate_reply(email, analysis), ensure_ascii=True)
+    return json_dumps(generate_reply(email, analysis))
@@ -1,7 +1,12 @@
 from gmail.fetch import fetch_emails
 
 
-def ingest_emails(creds, max_results=None):
-    """Ingest emails from Gmail using provided credentials."""
-    messages = fetch_emails(creds, max_results=max_results)
+def ingest_emails(creds=None, max_results=None, service=None):
+    """Ingest emails from Gmail, reusing the given service's connection when provided.
+    Falls back to the local token file when neither creds nor service is given."""
+    if creds is None and service is None:
+        from gmail.auth import get_credentials
+
+        creds = get_credentials()
+    messages = fetch_emails(creds, max_results=max_results, service=service)
     return messages
@@ -1,4 +1,6 @@
+import atexit
 import os
+from functools import lru_cache
 from pathlib import Path
 
 import faiss
@@ -11,6 +13,15 @@ except Exception:  # pragma: no cover - optional dependency
 ROOT_DIR = Path(__file__).resolve().parents[1]
 INDEX_PATH = ROOT_DIR / "db" / "semantic.index"
 EMBED_DIM = 1536
+# HNSW graph parameters: links per node, build-time and query-time beam widths.
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 64
+HNSW_EF_SEARCH = 32
+# New vectors are buffered and added to the index in batches of this size.
+ADD_BATCH_SIZE = max(1, int(os.getenv("INDEX_ADD_BATCH_SIZE", "64")))
+# The index is written to disk after this many inserts (and once at exit).
+INDEX_WRITE_EVERY = max(1, int(os.getenv("INDEX_WRITE_EVERY", "32")))
+EMBED_MODEL = "text-embedding-3-small"
 
 _client = None
 
@@ -29,32 +40,116 @@ def _get_client():
 def _load_index():
     if INDEX_PATH.exists():
         try:
-            return faiss.read_index(str(INDEX_PATH))
+            loaded = faiss.read_index(str(INDEX_PATH))
         except Exception:
-            pass
-    return faiss.IndexFlatL2(EMBED_DIM)
+            loaded = None
+        if loaded is not None:
+            # Indexes written before the switch to HNSW are still flat; they
+            # keep working since the stored embeddings are unit length.
+            if hasattr(loaded, "hnsw"):
+                loaded.hnsw.efSearch = HNSW_EF_SEARCH
+            return loaded
+    # Approximate nearest neighbours over normalized vectors: inner product
+    # is cosine similarity, and search cost grows ~log(N) instead of N.
+    new_index = faiss.IndexHNSWFlat(EMBED_DIM, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    new_index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    new_index.hnsw.efSearch = HNSW_EF_SEARCH
+    return new_index
 
 index = _load_index()
+_pending = []
+_pending_rows = 0
+_unsaved_adds = 0
 
 def embed(text):
+    return _embed_cached(text)
+
+# Identical texts (duplicate notifications, re-runs) reuse the embedding instead
+# of another API round-trip. Cached arrays are read-only since they are shared.
+@lru_cache(maxsize=1024)
+def _embed_cached(text):
     client = _get_client()
     emb = client.embeddings.create(
-        model="text-embedding-3-small",
+        model=EMBED_MODEL,
         input=text
     )
-    return np.array(emb.data[0].embedding).astype("float32")
+    vector = np.asarray(emb.data[0].embedding, dtype=np.float32).reshape(1, -1)
+    faiss.normalize_L2(vector)
+    vector = vector[0]
+    vector.setflags(write=False)
+    return vector
+
+def embed_many(texts):
+    # One embeddings request for the whole batch instead of one per text.
+    client = _get_client()
+    emb = client.embeddings.create(
+        model=EMBED_MODEL,
+        input=list(texts)
+    )
+    vectors = np.asarray([item.embedding for item in emb.data], dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
 
-def store_email(text):
+def _flush_pending():
+    global _pending_rows, _unsaved_adds
+    if not _pending:
+        return
+    batch = np.vstack(_pending)
+    _pending.clear()
+    _pending_rows = 0
+    index.add(batch)
+    _unsaved_adds += batch.shape[0]
+
+def _write_index():
+    global _unsaved_adds
+    if not _unsaved_adds:
+        return
+    # Write beside the live file and swap it in, so a crash mid-write never
+    # leaves a truncated index behind.
+    tmp_path = INDEX_PATH.with_suffix(".index.tmp")
     try:
-        index.add(embed(text).reshape(1, -1))
+        faiss.write_index(index, str(tmp_path))
+        os.replace(tmp_path, INDEX_PATH)
     except Exception:
         return
+    _unsaved_adds = 0
+
+def _flush_index():
     try:
-        faiss.write_index(index, str(INDEX_PATH))
+        _flush_pending()
     except Exception:
+        pass
+    _write_index()
+
+atexit.register(_flush_index)
+
+def _buffer_vectors(vectors):
+    global _pending_rows
+    _pending.append(vectors)
+    _pending_rows += len(vectors)
+    if _pending_rows >= ADD_BATCH_SIZE:
+        try:
+            _flush_pending()
+        except Exception:
+            return
+    if _unsaved_adds >= INDEX_WRITE_EVERY:
+        _write_index()
+
+def store_emails(texts):
+    texts = [text for text in texts if text]
+    if not texts:
         return
+    try:
+        vectors = embed_many(texts)
+    except Exception:
+        return
+    _buffer_vectors(vectors)
 
 def get_similar_emails(text):
+    try:
+        _flush_pending()
+    except Exception:
+        pass
     if index.ntotal == 0:
         return "None"
 
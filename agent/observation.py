@@ -1,56 +1,81 @@
 import base64
 from bs4 import BeautifulSoup
 
+try:
+    from selectolax.parser import HTMLParser
+except Exception:  # pragma: no cover - optional dependency
+    HTMLParser = None
+
+# Gmail accepts up to 100 calls per batch but rate-limits batches above ~50.
+OBSERVE_BATCH_SIZE = 50
+
 
 def _decode_body(data: str) -> str:
     if not data:
         return ""
     try:
-        decoded = base64.urlsafe_b64decode(data + "===")
+        decoded = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
         return decoded.decode("utf-8", errors="replace")
     except Exception:
         return ""
 
 
-def _extract_parts(payload):
-    parts = []
+def _iter_parts(payload):
     stack = [payload]
     while stack:
         part = stack.pop()
-        parts.append(part)
-        stack.extend(part.get("parts", []) or [])
-    return parts
+        yield part
+        stack.extend(part.get("parts") or ())
 
 def extract_body(payload):
-    parts = _extract_parts(payload)
+    body, _ = extract_body_with_kind(payload)
+    return body
+
+def extract_body_with_kind(payload):
+    # Returns (body, is_html) so plain-text bodies can skip HTML parsing.
     html_body = ""
     text_body = ""
 
-    for part in parts:
+    for part in _iter_parts(payload):
         mime = (part.get("mimeType") or "").lower()
+        # Only the first part of each kind is used; skip decoding the rest.
+        if mime == "text/html":
+            if html_body:
+                continue
+        elif mime == "text/plain":
+            if text_body:
+                continue
+        else:
+            continue
         body = part.get("body", {}) or {}
         data = body.get("data")
         if not data:
             continue
         content = _decode_body(data)
-        if mime == "text/html" and not html_body:
+        if mime == "text/html":
             html_body = content
-        elif mime == "text/plain" and not text_body:
-            text_body = content
+            # HTML wins over plain text, so nothing later can change the result.
+            break
+        text_body = content
 
-    return html_body or text_body or ""
+    if html_body:
+        return html_body, True
+    return text_body or "", False
 
-def observe_email(service, message_id):
-    msg = service.users().messages().get(
-        userId="me",
-        id=message_id,
-        format="full"
-    ).execute()
+def html_to_text(body):
+    # selectolax (C parser) when installed; BeautifulSoup otherwise or if it fails.
+    if HTMLParser is not None:
+        try:
+            return HTMLParser(body).text(separator="")
+        except Exception:
+            pass
+    return BeautifulSoup(body, "html.parser").get_text()
 
+def _observed_from_message(msg):
     headers = {h["name"]: h["value"] for h in msg["payload"]["headers"]}
 
-    body = extract_body(msg["payload"])
-    text = BeautifulSoup(body, "html.parser").get_text()
+    body, is_html = extract_body_with_kind(msg["payload"])
+    text = html_to_text(body) if is_html else body
 
     return {
         "email_id": msg["id"],
@@ -61,3 +86,36 @@ def observe_email(service, message_id):
         "timestamp": int(msg["internalDate"]),
         "content": text.strip()
     }
+
+def observe_email(service, message_id):
+    msg = service.users().messages().get(
+        userId="me",
+        id=message_id,
+        format="full"
+    ).execute()
+    return _observed_from_message(msg)
+
+def observe_emails(service, message_ids):
+    # Fetches messages through Gmail batch requests (one HTTP round-trip per
+    # OBSERVE_BATCH_SIZE messages). Results keep the order of message_ids;
+    # messages whose batched fetch failed are retried individually.
+    message_ids = list(message_ids)
+    messages = [None] * len(message_ids)
+
+    def _collect(request_id, response, exception):
+        if exception is None:
+            messages[int(request_id)] = response
+
+    for start in range(0, len(message_ids), OBSERVE_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=_collect)
+        for i in range(start, min(start + OBSERVE_BATCH_SIZE, len(message_ids))):
+            batch.add(
+                service.users().messages().get(userId="me", id=message_ids[i], format="full"),
+                request_id=str(i),
+            )
+        batch.execute()
+
+    return [
+        _observed_from_message(msg) if msg is not None else observe_email(service, message_id)
+        for message_id, msg in zip(message_ids, messages)
+    ]
@@ -1,93 +1,45 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from email.utils import parseaddr
 from typing import Any
 
+from agent._db import session_scope, upsert_many
+from agent._timeutils import normalize_timestamp, now_ms as _now_ms
 from db.models import EmailMemory
-from db.session import get_session, init_db
 
 
-def _normalize_timestamp(value: Any) -> str:
-    if value is None or value == "":
-        return ""
-    if isinstance(value, (int, float)):
-        ts = float(value)
-        if ts > 10**12:
-            ts = ts / 1000.0
-        return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
-    if isinstance(value, str):
-        try:
-            dt = datetime.fromisoformat(value)
-            return dt.isoformat()
-        except Exception:
-            try:
-                ts = float(value)
-                if ts > 10**12:
-                    ts = ts / 1000.0
-                return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
-            except Exception:
-                return value
-    return str(value)
+# Columns refreshed when an already stored email is observed again.
+_OBSERVATION_COLUMNS = ("sender", "subject", "body", "timestamp")
 
 
-def persist_observation(observed: dict[str, Any], user_id: int = None) -> EmailMemory:
-    init_db()
-    session = get_session()
-    try:
-        email_id = observed.get("email_id") or observed.get("id") or ""
-        query = session.query(EmailMemory).filter_by(email_id=email_id)
-        if user_id:
-            query = query.filter_by(user_id=user_id)
-        record = query.first()
-
-        sender = observed.get("from") or observed.get("sender") or ""
-        _, addr = parseaddr(sender)
+def _observation_values(observed: dict[str, Any]) -> dict[str, Any]:
+    sender = observed.get("from") or observed.get("sender") or ""
+    return {
+        "sender": sender,
+        "subject": observed.get("subject") or "",
+        "body": observed.get("content") or observed.get("body") or "",
+        "timestamp": normalize_timestamp(observed.get("timestamp"))[0],
+    }
 
-        subject = observed.get("subject") or ""
-        body = observed.get("content") or observed.get("body") or ""
-        timestamp = _normalize_timestamp(observed.get("timestamp"))
 
-        if record:
-            record.sender = sender
-            record.subject = subject
-            record.body = body
-            record.timestamp = timestamp
-            session.add(record)
-        else:
-            session.add(
-                EmailMemory(
-                    email_id=email_id,
-                    user_id=user_id,
-                    sender=sender,
-                    sender_type="unknown",
-                    promo=False,
-                    urgency="",
-                    subject=subject,
-                    body=body,
-                    timestamp=timestamp,
-                )
-            )
-        session.commit()
-        return record or session.query(EmailMemory).filter_by(email_id=email_id).first()
-    finally:
-        session.close()
-
-
-def store_reply_draft(observed: dict[str, Any], reply: str) -> None:
-    init_db()
-    session = get_session()
-    try:
+def persist_observations(observed_list: list[dict[str, Any]], user_id: int = None) -> None:
+    # Persists a whole ingestion batch as one multi-row upsert: the unique
+    # (user_id, email_id) key decides between insert and update, so there is
+    # no SELECT beforehand.
+    rows: dict[str, dict[str, Any]] = {}
+    for observed in observed_list:
         email_id = observed.get("email_id") or observed.get("id") or ""
-        record = session.query(EmailMemory).filter_by(email_id=email_id).first()
-        if not record:
-            return
-        record.reply_draft = reply or ""
-        record.reply_timestamp = datetime.now(tz=timezone.utc).isoformat()
-        session.add(record)
-        session.commit()
-    finally:
-        session.close()
+        rows[email_id] = {
+            **_observation_values(observed),
+            "email_id": email_id,
+            "user_id": user_id,
+            "sender_type": "unknown",
+            "promo": False,
+            "urgency": "",
+        }
+    if not rows:
+        return
+    with session_scope() as session:
+        upsert_many(session, EmailMemory, list(rows.values()), ("user_id", "email_id"), _OBSERVATION_COLUMNS)
 
 
 def store_action_state(
@@ -99,27 +51,29 @@ def store_action_state(
     urgent_flag: bool | None = None,
     needs_human_review: bool | None = None,
     reply_json: str | None = None,
+    user_id: int = None,
+    session=None,
+    now_ms: int | None = None,
 ) -> None:
-    init_db()
-    session = get_session()
-    try:
+    now = now_ms or _now_ms()
+    values: dict[str, Any] = {
+        "next_action": (next_action or "").strip(),
+        "action_reason": (action_reason or "").strip(),
+        "action_timestamp": now,
+    }
+    if task_status is not None:
+        values["task_status"] = task_status
+    if urgent_flag is not None:
+        values["urgent_flag"] = bool(urgent_flag)
+    if needs_human_review is not None:
+        values["needs_human_review"] = bool(needs_human_review)
+    if reply_json is not None:
+        values["reply_draft"] = reply_json
+        values["reply_timestamp"] = now
+    with session_scope(session) as session:
         email_id = observed.get("email_id") or observed.get("id") or ""
-        record = session.query(EmailMemory).filter_by(email_id=email_id).first()
-        if not record:
-            return
-        record.next_action = (next_action or "").strip()
-        record.action_reason = (action_reason or "").strip()
-        record.action_timestamp = datetime.now(tz=timezone.utc).isoformat()
-        if task_status is not None:
-            record.task_status = task_status
-        if urgent_flag is not None:
-            record.urgent_flag = bool(urgent_flag)
-        if needs_human_review is not None:
-            record.needs_human_review = bool(needs_human_review)
-        if reply_json is not None:
-            record.reply_draft = reply_json
-            record.reply_timestamp = datetime.now(tz=timezone.utc).isoformat()
-        session.add(record)
-        session.commit()
-    finally:
-        session.close()
+        # Gmail message ids are only unique per mailbox.
+        query = session.query(EmailMemory).filter_by(email_id=email_id)
+        if user_id:
+            query = query.filter_by(user_id=user_id)
+        query.update(values, synchronize_session=False)
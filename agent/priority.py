@@ -1,19 +1,33 @@
 from __future__ import annotations
 
-import json
 import logging
+import os
 from dataclasses import dataclass
-from datetime import datetime, timezone
 from email.utils import parseaddr
+from functools import lru_cache
 from typing import Any
 
+from sqlalchemy import func
+from sqlalchemy.orm import load_only
+
+from agent._db import ensure_db
+from agent._jsonutils import json_dumps, json_loads
+from agent._textclean import trim_email
+from agent._timeutils import iso_from_ms, normalize_timestamp, now_ms
 from ai.llm import call_llm
 from ai.prompts import PRIORITY_PROMPT
 from db.models import EmailMemory
-from db.session import get_session, init_db
+from db.session import get_session
 
 logger = logging.getLogger(__name__)
 
+# Reuse a sender's recent priority label instead of calling the LLM when the
+# last _STABLE_HISTORY_DECISIONS decisions agree at >= _STABLE_HISTORY_CONFIDENCE.
+# Set PRIORITY_HISTORY_FAST_PATH=0 to always ask the LLM (e.g. for audits).
+_PRIORITY_HISTORY_FAST_PATH = os.getenv("PRIORITY_HISTORY_FAST_PATH", "1").strip().lower() not in {"0", "false", "no"}
+_STABLE_HISTORY_DECISIONS = 5
+_STABLE_HISTORY_CONFIDENCE = 0.8
+
 
 @dataclass
 class PriorityResult:
@@ -25,72 +39,71 @@ class PriorityResult:
     tier: str
 
 
+@lru_cache(maxsize=4096)
 def _parse_email_address(value: str) -> tuple[str, str]:
+    # Senders repeat heavily across a mailbox, so parseaddr runs once per distinct header.
     _, addr = parseaddr(value or "")
-    domain = addr.split("@")[-1].lower() if "@" in addr else ""
-    return addr, domain
-
-
-def _normalize_timestamp(value: Any) -> tuple[str, datetime | None]:
-    if value is None or value == "":
-        return "", None
-    if isinstance(value, (int, float)):
-        timestamp = float(value)
-        if timestamp > 10**12:
-            timestamp = timestamp / 1000.0
-        dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
-        return dt.isoformat(), dt
-    if isinstance(value, str):
-        try:
-            dt = datetime.fromisoformat(value)
-            return dt.isoformat(), dt
-        except Exception:
-            try:
-                timestamp = float(value)
-                if timestamp > 10**12:
-                    timestamp = timestamp / 1000.0
-                dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
-                return dt.isoformat(), dt
-            except Exception:
-                return value, None
-    return str(value), None
+    _, at, domain = addr.rpartition("@")
+    return addr, domain.lower() if at else ""
 
 
 def _history_stats(session, sender: str) -> dict[str, Any]:
     if not sender:
         return {"count": 0, "last_timestamp": None, "recent_decisions": []}
 
-    rows = session.query(EmailMemory).filter_by(sender=sender).all()
-    if not rows:
+    count, last_ts = (
+        session.query(func.count(), func.max(func.nullif(EmailMemory.timestamp, "")))
+        .filter(EmailMemory.sender == sender)
+        .one()
+    )
+    if not count:
         return {"count": 0, "last_timestamp": None, "recent_decisions": []}
 
-    timestamps = [r.timestamp for r in rows if r.timestamp]
-    last_ts = max(timestamps) if timestamps else None
+    rows = (
+        session.query(
+            EmailMemory.priority_label,
+            EmailMemory.priority_confidence,
+            EmailMemory.priority_reasons,
+            EmailMemory.decision_timestamp,
+        )
+        .filter(EmailMemory.sender == sender, EmailMemory.priority_label != "")
+        .order_by(EmailMemory.decision_timestamp.desc(), EmailMemory.id.asc())
+        .limit(5)
+        .all()
+    )
     recent = [
         {
-            "label": r.priority_label,
-            "confidence": r.priority_confidence,
-            "reasons": r.priority_reasons.split(" | ") if r.priority_reasons else [],
-            "timestamp": r.decision_timestamp,
+            "label": label,
+            "confidence": confidence,
+            "reasons": reasons.split(" | ") if reasons else [],
+            "timestamp": iso_from_ms(decision_ts),
         }
-        for r in rows
-        if r.priority_label
+        for label, confidence, reasons, decision_ts in rows
     ]
-    recent = sorted(recent, key=lambda x: x.get("timestamp") or "", reverse=True)[:5]
     return {
-        "count": len(rows),
+        "count": count,
         "last_timestamp": last_ts,
         "recent_decisions": recent,
     }
 
 
+def _history_is_stable(recent: list[dict[str, Any]]) -> bool:
+    if len(recent) < _STABLE_HISTORY_DECISIONS:
+        return False
+    label = recent[0]["label"]
+    return all(
+        d["label"] == label and float(d["confidence"] or 0.0) >= _STABLE_HISTORY_CONFIDENCE
+        for d in recent[:_STABLE_HISTORY_DECISIONS]
+    )
+
+
 def _build_context(email: dict[str, Any], record: EmailMemory | None, session) -> dict[str, Any]:
     sender = (record.sender if record else email.get("from") or email.get("sender") or "")
     subject = (record.subject if record else email.get("subject") or "")
     body = (record.body if record else email.get("content") or email.get("body") or "")
     sender_addr, sender_domain = _parse_email_address(sender)
     timestamp_value = record.timestamp if record else email.get("timestamp") or ""
-    timestamp_iso, _ = _normalize_timestamp(timestamp_value)
+    timestamp_iso, _ = normalize_timestamp(timestamp_value)
     history = _history_stats(session, sender_addr or sender)
 
     return {
@@ -100,7 +113,7 @@ def _build_context(email: dict[str, Any], record: EmailMemory | None, session) -
         "sender_address": sender_addr,
         "sender_domain": sender_domain,
         "subject": subject,
-        "body": body[:4000],
+        "body": trim_email(body)[:4000],
         "timestamp": timestamp_iso,
         "history": {
             "count": history["count"],
@@ -112,7 +125,7 @@ def _build_context(email: dict[str, Any], record: EmailMemory | None, session) -
 
 def _coerce_llm_output(raw: str) -> dict[str, Any] | None:
     try:
-        return json.loads(raw)
+        return json_loads(raw)
     except Exception:
         return None
 
@@ -142,35 +155,62 @@ def _validate_llm_output(payload: dict[str, Any]) -> tuple[str, float, list[str]
 
 
 def compute_priority(email: dict[str, Any]) -> PriorityResult:
-    init_db()
+    ensure_db()
     session = get_session()
     try:
         email_id = email.get("email_id") or email.get("id")
         record = None
         if email_id:
-            record = session.query(EmailMemory).filter_by(email_id=email_id).first()
+            # Only the columns the prompt context reads; the other text columns
+            # (reply draft, reasons, action reason) are left unloaded.
+            record = (
+                session.query(EmailMemory)
+                .options(load_only(EmailMemory.id, EmailMemory.sender, EmailMemory.subject, EmailMemory.body, EmailMemory.timestamp))
+                .filter_by(email_id=email_id)
+                .first()
+            )
 
         context = _build_context(email, record, session)
-        user_payload = json.dumps(context, ensure_ascii=True)
-        raw = call_llm(PRIORITY_PROMPT, user_payload, temperature=0)
-
-        try:
-            payload = _coerce_llm_output(raw)
-            if payload is None:
-                raise ValueError("non-json response")
-            label, confidence, reasons = _validate_llm_output(payload)
-            error = None
-        except Exception as exc:
-            label = "medium"
-            confidence = 0.2
-            reasons = ["invalid llm response"]
-            error = exc
+        recent = context["history"]["recent_decisions"]
+        from_history = _PRIORITY_HISTORY_FAST_PATH and _history_is_stable(recent)
+        raw = ""
+        error = None
+        if from_history:
+            # The sender's recent decisions all agree with high confidence: reuse them.
+            label = recent[0]["label"]
+            confidence = min(float(d["confidence"]) for d in recent[:_STABLE_HISTORY_DECISIONS])
+            reasons = ["consistent sender history"]
+        else:
+            user_payload = json_dumps(context)
+            try:
+                raw = call_llm(PRIORITY_PROMPT, user_payload, temperature=0)
+            except Exception as exc:
+                # Provider timed out or kept failing after retries.
+                label = "medium"
+                confidence = 0.2
+                reasons = ["llm unavailable"]
+                error = exc
+            else:
+                try:
+                    payload = _coerce_llm_output(raw)
+                    if payload is None:
+                        raise ValueError("non-json response")
+                    label, confidence, reasons = _validate_llm_output(payload)
+                except Exception as exc:
+                    label = "medium"
+                    confidence = 0.2
+                    reasons = ["invalid llm response"]
+                    error = exc
 
         threshold = 0.6
         tier = "tier-2" if confidence < threshold else "tier-1"
+        if from_history:
+            hook_reason = "history-stable"
+        else:
+            hook_reason = "low confidence" if confidence < threshold else "not needed"
         llm_hook = {
             "eligible": confidence < threshold,
-            "reason": "low confidence" if confidence < threshold else "not needed",
+            "reason": hook_reason,
             "prompt_seed": {
                 "email_id": context.get("email_id"),
                 "sender": context.get("sender"),
@@ -182,7 +222,7 @@ def compute_priority(email: dict[str, Any]) -> PriorityResult:
 
         if error:
             logger.warning(
-                "priority llm parse failed",
+                "priority llm call failed" if not raw else "priority llm parse failed",
                 extra={
                     "email_id": context.get("email_id"),
                     "error": str(error),
@@ -191,7 +231,7 @@ def compute_priority(email: dict[str, Any]) -> PriorityResult:
             )
         else:
             logger.info(
-                "priority llm decision",
+                "priority history decision" if from_history else "priority llm decision",
                 extra={
                     "email_id": context.get("email_id"),
                     "label": label,
@@ -202,7 +242,7 @@ def compute_priority(email: dict[str, Any]) -> PriorityResult:
 
         score = int(round(confidence * 100))
 
-        decision_ts = datetime.now(tz=timezone.utc).isoformat()
+        decision_ts = now_ms()
         if record:
             record.priority_label = label
             record.priority_confidence = confidence
@@ -210,7 +250,6 @@ def compute_priority(email: dict[str, Any]) -> PriorityResult:
             record.priority_reasons = " | ".join(reasons)
             record.priority_tier = tier
             record.decision_timestamp = decision_ts
-            session.add(record)
             session.commit()
         else:
             sender = context.get("sender") or ""
@@ -1,154 +1,235 @@
 from __future__ import annotations
 
-import json
+import functools
 import os
-from datetime import datetime, timedelta, timezone
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any
 
+from sqlalchemy import update
+from sqlalchemy.exc import DBAPIError, DisconnectionError
+
+from agent._db import ensure_db, session_scope, upsert
+from agent._jsonutils import json_dumps, json_loads
+from agent._timeutils import now_ms as _now_ms
 from agent.actions import execute_next_action
 from agent.decision import analyze_email_with_status
 from db.models import RetryQueue
-from db.session import get_session, init_db
+from db.session import get_session
 
 _RETRY_MAX_ATTEMPTS = max(1, int(os.getenv("RETRY_MAX_ATTEMPTS", "8")))
 _RETRY_BASE_DELAY_SECONDS = max(1.0, float(os.getenv("RETRY_BASE_DELAY_SECONDS", "15")))
 _RETRY_MAX_DELAY_SECONDS = max(1.0, float(os.getenv("RETRY_MAX_DELAY_SECONDS", "3600")))
 _RETRY_BATCH_SIZE = max(1, int(os.getenv("RETRY_BATCH_SIZE", "10")))
+# Row status changes are committed together every this many processed rows.
+_RETRY_BATCH_COMMIT_SIZE = max(1, int(os.getenv("RETRY_BATCH_COMMIT_SIZE", "10")))
+# Due rows analyzed at once; their LLM calls still share the call_llm rate limit.
+_RETRY_CONCURRENCY = max(1, int(os.getenv("RETRY_CONCURRENCY", "4")))
+
+
+def _next_retry_timestamp(previous_delay: float) -> int:
+    # Decorrelated jitter: each delay is drawn from [base, 3 * previous delay],
+    # so rows that failed together do not come due together again.
+    delay = min(
+        _RETRY_MAX_DELAY_SECONDS,
+        random.uniform(_RETRY_BASE_DELAY_SECONDS, max(_RETRY_BASE_DELAY_SECONDS, previous_delay) * 3),
+    )
+    return _now_ms() + int(delay * 1000)
+
+
+def _is_disconnect(exc: BaseException) -> bool:
+    # A dropped database connection, as opposed to a failure of the retried work.
+    return isinstance(exc, DisconnectionError) or (
+        isinstance(exc, DBAPIError) and bool(exc.connection_invalidated)
+    )
+
+
+def _retry_on_disconnect(max_attempts: int = 2):
+    # Re-runs an idempotent database operation when its connection was dropped;
+    # the pool hands out a fresh connection on the next attempt.
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as exc:
+                    if attempt >= max_attempts or not _is_disconnect(exc):
+                        raise
+        return wrapper
+    return decorator
+
+
+@_retry_on_disconnect(max_attempts=2)
+def enqueue_retry(observed: dict[str, Any], operation: str, error: str = "", user_id: int = None) -> None:
+    email_id = observed.get("email_id") or observed.get("id") or ""
+    if not email_id:
+        return
+    now = _now_ms()
+    payload = json_dumps({"observed": observed})
+    # One statement: refresh the pending row for this email/operation, or add one.
+    update_values = {"payload": payload, "updated_at": now}
+    if error:
+        update_values["last_error"] = error
+    with session_scope() as session:
+        upsert(
+            session,
+            RetryQueue,
+            {
+                "email_id": email_id,
+                "user_id": user_id,
+                "operation": operation or "analyze_and_execute",
+                "payload": payload,
+                "status": "pending",
+                "pending_key": 1,
+                "attempts": 0,
+                "next_retry_at": now,
+                "last_error": error or "",
+                "created_at": now,
+                "updated_at": now,
+            },
+            ("user_id", "email_id", "operation", "pending_key"),
+            update_values,
+        )
 
 
-def _now() -> datetime:
-    return datetime.now(tz=timezone.utc)
-
-
-def _iso(dt: datetime) -> str:
-    return dt.isoformat()
-
-
-def _parse_iso(value: str) -> datetime | None:
-    if not value:
-        return None
+def _retry_values(row, error: str, now: int) -> dict[str, Any]:
+    # Column values for a failed attempt: rescheduled, or failed for good once
+    # out of attempts. Every mapping has the same keys so they update together.
+    # The last delay is recoverable from the previous schedule: both timestamps
+    # were written together when the row was last rescheduled.
+    previous_delay = 0.0
+    if row.attempts:
+        previous_delay = max(0, int(row.next_retry_at or 0) - int(row.updated_at or 0)) / 1000
+    attempts = int(row.attempts or 0) + 1
+    exhausted = attempts >= _RETRY_MAX_ATTEMPTS
+    return {
+        "id": row.id,
+        "attempts": attempts,
+        "last_error": error,
+        "updated_at": now,
+        "status": "failed" if exhausted else "pending",
+        "pending_key": None if exhausted else 1,
+        "next_retry_at": row.next_retry_at if exhausted else _next_retry_timestamp(previous_delay),
+    }
+
+
+def _commit_batch(session, done_ids: list[int], retries: list[dict[str, Any]]) -> None:
+    # One UPDATE for every finished row and one executemany for the rest.
+    try:
+        if done_ids:
+            session.execute(
+                update(RetryQueue)
+                .where(RetryQueue.id.in_(done_ids))
+                .values(status="done", pending_key=None, updated_at=_now_ms())
+            )
+        if retries:
+            session.bulk_update_mappings(RetryQueue, retries)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    done_ids.clear()
+    retries.clear()
+
+
+def _analyze_row(row) -> tuple[dict[str, Any] | None, dict[str, Any] | None, str] | None:
+    # Parses and analyzes one due row; safe to run on a worker thread since it
+    # only calls the LLM. Returns (observed, analysis, "") when the action should
+    # run, (None, None, error) when the attempt already failed, or None when the
+    # database connection was lost so the row stays pending without spending
+    # one of its attempts.
+    payload = {}
     try:
-        return datetime.fromisoformat(value)
+        payload = json_loads(row.payload) if row.payload else {}
     except Exception:
-        return None
-
-
-def _next_retry_timestamp(attempts: int) -> str:
-    delay = min(_RETRY_MAX_DELAY_SECONDS, _RETRY_BASE_DELAY_SECONDS * (2 ** max(0, attempts - 1)))
-    return _iso(_now() + timedelta(seconds=delay))
+        payload = {}
+    observed = payload.get("observed") if isinstance(payload, dict) else None
+    if not isinstance(observed, dict):
+        return None, None, "retry payload invalid"
+    if row.operation not in {"analyze_and_execute", "analyze_and_draft"}:
+        return None, None, f"unsupported retry operation: {row.operation}"
+    try:
+        analysis, analysis_ok = analyze_email_with_status(observed)
+    except Exception as exc:
+        if _is_disconnect(exc):
+            return None
+        return None, None, f"retry execution failed: {exc.__class__.__name__}"
+    if not analysis_ok:
+        return None, None, str(analysis.get("Reasoning", "analysis failed"))
+    return observed, analysis, ""
 
 
-def enqueue_retry(observed: dict[str, Any], operation: str, error: str = "", user_id: int = None) -> None:
-    init_db()
-    session = get_session()
-    now = _iso(_now())
+def _execute_row(row, observed: dict[str, Any], analysis: dict[str, Any], service: Any = None, cal_service: Any = None) -> tuple[bool, str] | None:
+    # Runs the row's action. Called on one thread at a time: the Gmail and
+    # Calendar services share one httplib2.Http each, which is not thread-safe.
     try:
-        email_id = observed.get("email_id") or observed.get("id") or ""
-        if not email_id:
-            return
-
-        query = session.query(RetryQueue).filter_by(email_id=email_id, operation=operation, status="pending")
-        if user_id:
-            query = query.filter_by(user_id=user_id)
-        pending = query.order_by(RetryQueue.id.desc()).first()
-        if pending:
-            pending.payload = json.dumps({"observed": observed}, ensure_ascii=True)
-            pending.last_error = error or pending.last_error
-            pending.updated_at = now
-            session.add(pending)
-            session.commit()
-            return
-
-        session.add(
-            RetryQueue(
-                email_id=email_id,
-                user_id=user_id,
-                operation=operation or "analyze_and_execute",
-                payload=json.dumps({"observed": observed}, ensure_ascii=True),
-                status="pending",
-                attempts=0,
-                next_retry_at=now,
-                last_error=error or "",
-                created_at=now,
-                updated_at=now,
-            )
+        _, action_ok, action_error = execute_next_action(
+            observed, analysis, service=service, cal_service=cal_service, user_id=row.user_id
         )
-        session.commit()
-    finally:
-        session.close()
-
-
-def _mark_done(session, row: RetryQueue) -> None:
-    row.status = "done"
-    row.updated_at = _iso(_now())
-    session.add(row)
-    session.commit()
-
-
-def _schedule_retry(session, row: RetryQueue, error: str) -> None:
-    row.attempts = int(row.attempts or 0) + 1
-    row.last_error = error
-    row.updated_at = _iso(_now())
-    if row.attempts >= _RETRY_MAX_ATTEMPTS:
-        row.status = "failed"
-    else:
-        row.status = "pending"
-        row.next_retry_at = _next_retry_timestamp(row.attempts)
-    session.add(row)
-    session.commit()
-
-
-def _run_analyze_and_execute(observed: dict[str, Any], service: Any = None, cal_service: Any = None, user_id: int = None) -> tuple[bool, str]:
-    analysis, analysis_ok = analyze_email_with_status(observed)
-    if not analysis_ok:
-        return False, str(analysis.get("Reasoning", "analysis failed"))
-    _, action_ok, action_error = execute_next_action(observed, analysis, service=service, cal_service=cal_service, user_id=user_id)
+    except Exception as exc:
+        if _is_disconnect(exc):
+            return None
+        return False, f"retry execution failed: {exc.__class__.__name__}"
     return action_ok, action_error
 
 
 def process_retry_queue(service: Any = None, cal_service: Any = None, limit: int | None = None, user_id: int = None) -> int:
-    init_db()
+    ensure_db()
     session = get_session()
     processed = 0
-    now = _now()
+    done_ids: list[int] = []
+    retries: list[dict[str, Any]] = []
     batch_limit = max(1, int(limit or _RETRY_BATCH_SIZE))
+    pool = None
     try:
-        query = session.query(RetryQueue).filter_by(status="pending")
+        # Only rows that are due; the database applies the limit.
+        query = session.query(
+            RetryQueue.id,
+            RetryQueue.user_id,
+            RetryQueue.operation,
+            RetryQueue.payload,
+            RetryQueue.attempts,
+            RetryQueue.next_retry_at,
+            RetryQueue.updated_at,
+        ).filter(
+            RetryQueue.status == "pending",
+            RetryQueue.next_retry_at <= _now_ms(),
+        )
         if user_id:
-            query = query.filter_by(user_id=user_id)
-        rows = query.order_by(RetryQueue.id.asc()).all()
-        for row in rows:
-            if processed >= batch_limit:
-                break
-            due = _parse_iso(row.next_retry_at)
-            if due and due > now:
+            query = query.filter(RetryQueue.user_id == user_id)
+        rows = query.order_by(RetryQueue.id.asc()).limit(batch_limit).all()
+        # Only the LLM analyses run concurrently; actions go through the shared
+        # Gmail/Calendar services one row at a time on this thread, which also
+        # owns the session the outcomes are recorded in.
+        if len(rows) <= 1 or _RETRY_CONCURRENCY == 1:
+            analyses = ((row, _analyze_row(row)) for row in rows)
+        else:
+            pool = ThreadPoolExecutor(max_workers=min(_RETRY_CONCURRENCY, len(rows)))
+            futures = {pool.submit(_analyze_row, row): row for row in rows}
+            analyses = ((futures[future], future.result()) for future in as_completed(futures))
+        for row, analyzed in analyses:
+            if analyzed is None:
                 continue
-
-            payload = {}
-            try:
-                payload = json.loads(row.payload or "{}")
-            except Exception:
-                payload = {}
-            observed = payload.get("observed") if isinstance(payload, dict) else None
-            if not isinstance(observed, dict):
-                _schedule_retry(session, row, "retry payload invalid")
-                processed += 1
-                continue
-
-            try:
-                if row.operation in {"analyze_and_execute", "analyze_and_draft"}:
-                    ok, error = _run_analyze_and_execute(observed, service=service, cal_service=cal_service, user_id=row.user_id)
-                else:
-                    ok, error = False, f"unsupported retry operation: {row.operation}"
-            except Exception as exc:
-                ok = False
-                error = f"retry execution failed: {exc.__class__.__name__}"
-
+            observed, analysis, error = analyzed
+            if observed is None:
+                outcome = (False, error)
+            else:
+                outcome = _execute_row(row, observed, analysis, service, cal_service)
+                if outcome is None:
+                    continue
+            ok, error = outcome
             if ok:
-                _mark_done(session, row)
+                done_ids.append(row.id)
             else:
-                _schedule_retry(session, row, error or "retry failed")
+                retries.append(_retry_values(row, error or "retry failed", _now_ms()))
             processed += 1
+            if processed % _RETRY_BATCH_COMMIT_SIZE == 0:
+                _commit_batch(session, done_ids, retries)
+        if done_ids or retries:
+            _commit_batch(session, done_ids, retries)
         return processed
     finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
         session.close()
@@ -1,6 +1,12 @@
+import atexit
+import hashlib
 import os
 import random
+import threading
 import time
+from collections import OrderedDict
+
+from ai import semantic_cache
 
 try:
     from dotenv import load_dotenv
@@ -23,17 +29,43 @@ _GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 _LLM_MAX_ATTEMPTS = max(1, int(os.getenv("LLM_MAX_ATTEMPTS", "3")))
 _LLM_BACKOFF_BASE_SECONDS = max(0.0, float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1.0")))
 _LLM_BACKOFF_MAX_SECONDS = max(0.0, float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8.0")))
-_LLM_BACKOFF_JITTER_SECONDS = max(0.0, float(os.getenv("LLM_BACKOFF_JITTER_SECONDS", "0.25")))
 _LLM_MIN_INTERVAL_SECONDS = max(0.0, float(os.getenv("LLM_MIN_INTERVAL_SECONDS", "0.5")))
-_last_call_monotonic = 0.0
+# Per-request timeout; each retry allows _LLM_TIMEOUT_GROWTH times longer so a
+# slow provider is cut off early without failing requests that are merely slow.
+_LLM_REQUEST_TIMEOUT_SECONDS = max(1.0, float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "15")))
+_LLM_TIMEOUT_GROWTH = max(1.0, float(os.getenv("LLM_TIMEOUT_GROWTH", "1.5")))
+# Token bucket: LLM_RATE_PER_SEC sustained (defaults to one call per
+# LLM_MIN_INTERVAL_SECONDS), with up to LLM_BURST calls banked while idle.
+_LLM_RATE_PER_SEC = max(0.0, float(os.getenv(
+    "LLM_RATE_PER_SEC",
+    str(1.0 / _LLM_MIN_INTERVAL_SECONDS) if _LLM_MIN_INTERVAL_SECONDS > 0 else "0",
+)))
+_LLM_BURST = max(1.0, float(os.getenv("LLM_BURST", "1")))
+_bucket_tokens = _LLM_BURST
+_bucket_updated = time.monotonic()
+_throttle_lock = threading.Lock()
+# Responses to deterministic (temperature 0) prompts, least recently used first.
+_LLM_CACHE_MAX = max(0, int(os.getenv("LLM_CACHE_MAX", "1024")))
+_LLM_CACHE_TTL_SECONDS = max(0.0, float(os.getenv("LLM_CACHE_TTL_SECS", "3600")))
+_llm_cache = OrderedDict()
+_llm_cache_lock = threading.Lock()
+_llm_cache_hits = 0
+_llm_cache_misses = 0
+# One client per process so its HTTP connection pool (and TLS sessions) is reused.
+_client = None
+_client_lock = threading.Lock()
 
 def _get_client():
     """
-    Returns the Groq client instance, initializing it if necessary.
+    Returns the shared Groq client instance, initializing it on first use.
+    The client is thread-safe, so all callers share its connection pool.
 
     Input: None
     Output: <Groq client instance>
     """
+    global _client
+    if _client is not None:
+        return _client
     if Groq is None:
         raise RuntimeError(
             "Groq client not installed. Run: pip install groq"
@@ -42,31 +74,119 @@ def _get_client():
         raise RuntimeError(
             "GROQ_API_KEY is not set. Set it in your environment."
         )
-    return Groq(api_key=_GROQ_API_KEY)
+    with _client_lock:
+        if _client is None:
+            # call_llm owns retries and timeouts; disable the SDK's own retry loop.
+            _client = Groq(api_key=_GROQ_API_KEY, max_retries=0)
+    return _client
+
+def _close_client() -> None:
+    if _client is not None:
+        try:
+            _client.close()
+        except Exception:
+            pass
+
+atexit.register(_close_client)
 
 def _throttle() -> None:
     """
-    Throttles the LLM calls to respect the rate limits.
+    Throttles the LLM calls to respect the rate limits with a token bucket.
+    Idle time refills up to LLM_BURST tokens, so short bursts start at once;
+    beyond that each caller takes a token under a lock (going into debt when
+    the bucket is empty) and sleeps until its token has been refilled.
 
     Input: None
     Output: None
     """
-    global _last_call_monotonic
-    now = time.monotonic()
-    wait_for = _LLM_MIN_INTERVAL_SECONDS - (now - _last_call_monotonic)
+    global _bucket_tokens, _bucket_updated
+    if _LLM_RATE_PER_SEC <= 0:
+        return
+    with _throttle_lock:
+        now = time.monotonic()
+        _bucket_tokens = min(_LLM_BURST, _bucket_tokens + (now - _bucket_updated) * _LLM_RATE_PER_SEC)
+        _bucket_updated = now
+        _bucket_tokens -= 1.0
+        wait_for = -_bucket_tokens / _LLM_RATE_PER_SEC if _bucket_tokens < 0 else 0.0
     if wait_for > 0:
         time.sleep(wait_for)
-    _last_call_monotonic = time.monotonic()
+
+def _cache_key(system, user):
+    """
+    Builds the response cache key for a model, system prompt and user prompt.
+
+    Input: system="You are...", user="Hello..."
+    Output: "9f86d081884c7d65..."
+    """
+    return hashlib.sha256(f"{_GROQ_MODEL}\0{system}\0{user}".encode("utf-8")).hexdigest()
+
+def _cache_get(key):
+    """
+    Returns a cached response that has not expired, or None.
+
+    Input: key="9f86d081884c7d65..."
+    Output: "Hi there!"
+    """
+    global _llm_cache_hits, _llm_cache_misses
+    with _llm_cache_lock:
+        entry = _llm_cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= _LLM_CACHE_TTL_SECONDS:
+            _llm_cache.move_to_end(key)
+            _llm_cache_hits += 1
+            return entry[1]
+        if entry is not None:
+            del _llm_cache[key]
+        _llm_cache_misses += 1
+    return None
+
+def _cache_put(key, response):
+    """
+    Stores a response, evicting the least recently used entry when full.
+
+    Input: key="9f86d081884c7d65...", response="Hi there!"
+    Output: None
+    """
+    with _llm_cache_lock:
+        _llm_cache[key] = (time.monotonic(), response)
+        _llm_cache.move_to_end(key)
+        while len(_llm_cache) > _LLM_CACHE_MAX:
+            _llm_cache.popitem(last=False)
+
+def llm_cache_stats():
+    """
+    Returns response cache hit/miss counters and current size.
+
+    Input: None
+    Output: {"hits": 3, "misses": 10, "size": 10}
+    """
+    with _llm_cache_lock:
+        return {"hits": _llm_cache_hits, "misses": _llm_cache_misses, "size": len(_llm_cache)}
 
 def call_llm(system, user, temperature=0):
     """
     Calls the LLM with the provided system and user prompts.
+    Temperature-0 responses are served from an in-process LRU cache when possible.
+    Each attempt is bounded by a request timeout; failures and timeouts are
+    retried with decorrelated-jitter backoff up to LLM_MAX_ATTEMPTS times.
 
     Input: system="You are...", user="Hello..."
     Output: "Hi there!"
     """
+    # Only deterministic calls are cached; sampled outputs are meant to vary.
+    key = None
+    semantic_query = None
+    if temperature == 0:
+        if _LLM_CACHE_MAX > 0 and _LLM_CACHE_TTL_SECONDS > 0:
+            key = _cache_key(system, user)
+            cached = _cache_get(key)
+            if cached is not None:
+                return cached
+        similar, semantic_query = semantic_cache.lookup(_GROQ_MODEL, system, user)
+        if similar is not None:
+            return similar
     client = _get_client()
     last_error = None
+    delay = _LLM_BACKOFF_BASE_SECONDS
     for attempt in range(1, _LLM_MAX_ATTEMPTS + 1):
         try:
             _throttle()
@@ -76,17 +196,24 @@ def call_llm(system, user, temperature=0):
                     {"role": "system", "content": system},
                     {"role": "user", "content": user}
                 ],
-                temperature=temperature
+                temperature=temperature,
+                timeout=_LLM_REQUEST_TIMEOUT_SECONDS * (_LLM_TIMEOUT_GROWTH ** (attempt - 1)),
             )
-            return response.choices[0].message.content.strip()
+            content = response.choices[0].message.content.strip()
+            if key is not None:
+                _cache_put(key, content)
+            if semantic_query is not None:
+                semantic_cache.store(_GROQ_MODEL, system, semantic_query, content)
+            return content
         except Exception as exc:
             last_error = exc
             if attempt >= _LLM_MAX_ATTEMPTS:
                 break
+            # Decorrelated jitter: concurrent callers that failed together
+            # spread out instead of retrying in lockstep.
             delay = min(
                 _LLM_BACKOFF_MAX_SECONDS,
-                _LLM_BACKOFF_BASE_SECONDS * (2 ** (attempt - 1)),
+                random.uniform(_LLM_BACKOFF_BASE_SECONDS, delay * 3),
             )
-            jitter = random.uniform(0.0, _LLM_BACKOFF_JITTER_SECONDS)
-            time.sleep(delay + jitter)
+            time.sleep(delay)
     raise last_error
@@ -0,0 +1,157 @@
+import atexit
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+CACHE_PATH = ROOT_DIR / "db" / "semantic_cache.npz"
+# Off by default: a hit reuses the answer to a *similar* prompt, not the same one.
+SEMANTIC_CACHE_ENABLED = os.getenv("LLM_SEMANTIC_CACHE", "0").strip().lower() in {"1", "true", "yes"}
+SEMANTIC_THRESHOLD = min(1.0, max(0.0, float(os.getenv("LLM_SEMANTIC_THRESHOLD", "0.92"))))
+# Entries kept per system prompt; the oldest entry is overwritten once full.
+SEMANTIC_CACHE_MAX = max(1, int(os.getenv("LLM_SEMANTIC_CACHE_MAX", "2048")))
+
+_lock = threading.Lock()
+_buckets = {}
+_loaded = False
+_dirty = False
+
+
+class _Bucket:
+    """
+    Fixed-capacity ring of unit vectors and the responses they map to.
+    """
+
+    def __init__(self, dim):
+        self.store = np.empty((0, dim), dtype=np.float32)
+        self.responses = []
+        self.next = 0
+
+    def search(self, query):
+        if not self.responses or query.shape[0] != self.store.shape[1]:
+            return None
+        sims = self.store[: len(self.responses)] @ query
+        best = int(np.argmax(sims))
+        return float(sims[best]), self.responses[best]
+
+    def add(self, vector, response):
+        size = len(self.responses)
+        if size < SEMANTIC_CACHE_MAX:
+            if size == len(self.store):
+                grown = np.empty((min(SEMANTIC_CACHE_MAX, max(16, size * 2)), self.store.shape[1]), dtype=np.float32)
+                grown[:size] = self.store
+                self.store = grown
+            self.store[size] = vector
+            self.responses.append(response)
+            return
+        self.store[self.next] = vector
+        self.responses[self.next] = response
+        self.next = (self.next + 1) % SEMANTIC_CACHE_MAX
+
+    def ordered(self):
+        size = len(self.responses)
+        order = list(range(self.next, size)) + list(range(0, self.next))
+        return self.store[order], [self.responses[i] for i in order]
+
+
+def _bucket_key(model, system):
+    return hashlib.sha256(f"{model}\0{system}".encode("utf-8")).hexdigest()
+
+
+def _embed(text):
+    """
+    Returns the unit-length embedding for text, reusing the memory module's client.
+
+    Input: text="Hello..."
+    Output: array([0.01, ...], dtype=float32)
+    """
+    from agent.memory import embed
+
+    return embed(text)
+
+
+def _load():
+    global _loaded
+    _loaded = True
+    if not CACHE_PATH.exists():
+        return
+    try:
+        with np.load(CACHE_PATH) as data:
+            for i, key in enumerate(data["keys"]):
+                vectors = data[f"v{i}"]
+                bucket = _Bucket(vectors.shape[1])
+                for vector, response in zip(vectors, data[f"r{i}"]):
+                    bucket.add(vector, str(response))
+                _buckets[str(key)] = bucket
+    except Exception:
+        _buckets.clear()
+
+
+def _save():
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+        arrays = {"keys": np.array(list(_buckets), dtype=str)}
+        for i, bucket in enumerate(_buckets.values()):
+            vectors, responses = bucket.ordered()
+            arrays[f"v{i}"] = vectors
+            arrays[f"r{i}"] = np.array(responses, dtype=str)
+        _dirty = False
+    tmp_path = CACHE_PATH.with_suffix(".tmp")
+    try:
+        with open(tmp_path, "wb") as fh:
+            np.savez(fh, **arrays)
+        os.replace(tmp_path, CACHE_PATH)
+    except Exception:
+        return
+
+
+atexit.register(_save)
+
+
+def lookup(model, system, user):
+    """
+    Returns the cached response of the most similar earlier prompt when its
+    cosine similarity reaches LLM_SEMANTIC_THRESHOLD, plus the query vector so
+    a miss can be stored without embedding the prompt again.
+
+    Input: model="llama-3.3-70b-instant", system="You are...", user="Hello..."
+    Output: ("Hi there!", array([...])) or (None, array([...]))
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return None, None
+    try:
+        query = _embed(user)
+    except Exception:
+        return None, None
+    with _lock:
+        if not _loaded:
+            _load()
+        bucket = _buckets.get(_bucket_key(model, system))
+        match = bucket.search(query) if bucket is not None else None
+    if match is not None and match[0] >= SEMANTIC_THRESHOLD:
+        return match[1], query
+    return None, query
+
+
+def store(model, system, query, response):
+    """
+    Remembers a response under the query vector returned by lookup().
+
+    Input: model="llama-3.3-70b-instant", system="You are...", query=array([...]), response="Hi there!"
+    Output: None
+    """
+    global _dirty
+    if query is None:
+        return
+    key = _bucket_key(model, system)
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None or bucket.store.shape[1] != len(query):
+            bucket = _buckets[key] = _Bucket(len(query))
+        bucket.add(query, response)
+        _dirty = True
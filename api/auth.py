@@ -1,5 +1,11 @@
+import hashlib
+import hmac
 import os
+import secrets
+import threading
+import time
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from typing import Optional, Dict, Any
@@ -11,6 +17,19 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = int(os.getenv("JWT_EXPIRATION_HOURS", "24"))
+_JWT_ALGORITHMS = [JWT_ALGORITHM]
+_JWT_OPTIONS = {"require": ["exp", "iat"]}
+# Token digest -> (exp epoch seconds, verified payload), oldest first.
+_TOKEN_CACHE_SIZE = 4096
+_token_cache: Dict[bytes, tuple] = {}
+_token_cache_lock = threading.Lock()
+
+# Recently verified (password, hash) pairs, oldest first.
+_VERIFY_TTL_SECONDS = max(0.0, float(os.getenv("AUTH_VERIFY_TTL_SECS", "60")))
+_VERIFY_CACHE_SIZE = 1024
+_VERIFY_CACHE_SECRET = secrets.token_bytes(32)
+_verify_cache: OrderedDict[str, float] = OrderedDict()
+_verify_cache_lock = threading.Lock()
 
 
 def hash_password(password: str) -> str:
@@ -18,9 +37,35 @@ def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def _verify_cache_key(plain_password: str, hashed_password: str) -> str:
+    # Keyed with a per-process secret so cached keys cannot be brute-forced offline.
+    message = plain_password.encode("utf-8") + b"\0" + hashed_password.encode("utf-8")
+    return hmac.new(_VERIFY_CACHE_SECRET, message, hashlib.sha256).hexdigest()
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Verify a password against its hash.
+
+    Successful verifications are remembered for AUTH_VERIFY_TTL_SECS so repeat
+    logins skip bcrypt. Failures are never cached, so every wrong guess still
+    pays the full bcrypt cost. Set AUTH_VERIFY_TTL_SECS=0 to disable.
+    """
+    if _VERIFY_TTL_SECONDS <= 0:
+        return pwd_context.verify(plain_password, hashed_password)
+    key = _verify_cache_key(plain_password, hashed_password)
+    now = time.monotonic()
+    with _verify_cache_lock:
+        verified_at = _verify_cache.get(key)
+        if verified_at is not None and now - verified_at <= _VERIFY_TTL_SECONDS:
+            return True
+    if not pwd_context.verify(plain_password, hashed_password):
+        return False
+    with _verify_cache_lock:
+        _verify_cache[key] = now
+        _verify_cache.move_to_end(key)
+        while len(_verify_cache) > _VERIFY_CACHE_SIZE:
+            _verify_cache.popitem(last=False)
+    return True
 
 
 def create_jwt_token(user_id: int, email: str) -> str:
@@ -35,14 +80,34 @@ def create_jwt_token(user_id: int, email: str) -> str:
 
 
 def decode_jwt_token(token: str) -> Optional[Dict[str, Any]]:
-    """Decode and validate a JWT token."""
+    """Decode and validate a JWT token.
+
+    Verified payloads are cached until the token's own expiry, so repeat
+    requests with the same token skip signature verification.
+    """
+    key = hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+    if cached is not None:
+        if now < cached[0]:
+            return dict(cached[1])
+        with _token_cache_lock:
+            _token_cache.pop(key, None)
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
+        payload = jwt.decode(token, JWT_SECRET, algorithms=_JWT_ALGORITHMS, options=_JWT_OPTIONS)
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    with _token_cache_lock:
+        if len(_token_cache) >= _TOKEN_CACHE_SIZE:
+            for stale in [k for k, (exp, _) in _token_cache.items() if exp <= now]:
+                del _token_cache[stale]
+            while len(_token_cache) >= _TOKEN_CACHE_SIZE:
+                del _token_cache[next(iter(_token_cache))]
+        _token_cache[key] = (float(payload["exp"]), dict(payload))
+    return payload
 
 
 def extract_user_from_token(token: str) -> Optional[Dict[str, Any]]:
@@ -4,7 +4,6 @@ from pathlib import Path
 import threading
 import time
 from typing import List, Optional
-from datetime import datetime, timezone
 import json
 
 from dotenv import load_dotenv
@@ -17,14 +16,24 @@ ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
+from agent._logging import configure_logging
+
+# Agent progress is logged; LOG_LEVEL=DEBUG also logs email bodies and analyses.
+configure_logging()
+
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, EmailStr
-from sqlalchemy import desc
+from sqlalchemy import desc, exists, func, select
+from sqlalchemy.orm import Session
 
 from email_agent import app as agent_app
-from db.session import get_session, init_db
+from agent._jsonutils import json_loads
+from agent._timeutils import iso_from_ms, now_ms
+from ai.llm import llm_cache_stats
+from db.session import get_db, init_db
 from db.models import EmailMemory, BehaviorLog, RetryQueue, User, UserCredentials
 from api.auth import (
     hash_password,
@@ -34,7 +43,7 @@ from api.auth import (
 )
 from gmail.auth import store_credentials_for_user
 
-app = FastAPI(title="Email Agent API")
+app = FastAPI(title="Email Agent API", default_response_class=ORJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -145,20 +154,23 @@ def get_config():
 # ============== AUTHENTICATION ENDPOINTS ==============
 
 @app.post("/auth/signup", response_model=SignupResponse)
-def signup(req: SignupRequest):
+def signup(req: SignupRequest, session: Session = Depends(get_db)):
     """Register a new user."""
-    session = get_session()
     try:
-        # Check if email already exists
-        existing_user = session.query(User).filter_by(email=req.email).first()
-        if existing_user:
+        # Hash before touching the database so a pooled connection is not
+        # held for the duration of bcrypt. This sync endpoint already runs on
+        # FastAPI's threadpool, so the event loop is not blocked either way.
+        password_hash = hash_password(req.password)
+
+        # Check if email already exists; EXISTS avoids loading the row
+        if session.query(exists().where(User.email == req.email)).scalar():
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Create new user
-        now = datetime.now(tz=timezone.utc).isoformat()
+        now = now_ms()
         user = User(
             email=req.email,
-            password_hash=hash_password(req.password),
+            password_hash=password_hash,
             gmail_email=req.gmail_email,
             is_active=True,
             created_at=now,
@@ -182,33 +194,33 @@ def signup(req: SignupRequest):
         if isinstance(e, HTTPException):
             raise
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 
 @app.post("/auth/login", response_model=LoginResponse)
-def login(req: LoginRequest):
+def login(req: LoginRequest, session: Session = Depends(get_db)):
     """Login user."""
-    session = get_session()
-    try:
-        user = session.query(User).filter_by(email=req.email).first()
-        if not user or not verify_password(req.password, user.password_hash):
-            raise HTTPException(status_code=401, detail="Invalid email or password")
-        
-        if not user.is_active:
-            raise HTTPException(status_code=403, detail="User account is inactive")
-        
-        # Create JWT token
-        token = create_jwt_token(user.id, user.email)
-        
-        return LoginResponse(
-            message="Login successful",
-            token=token,
-            user_id=user.id,
-            gmail_email=user.gmail_email,
-        )
-    finally:
-        session.close()
+    user = (
+        session.query(User.id, User.email, User.password_hash, User.is_active, User.gmail_email)
+        .filter_by(email=req.email)
+        .first()
+    )
+    # Return the connection to the pool before the bcrypt check.
+    session.close()
+    if not user or not verify_password(req.password, user.password_hash):
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="User account is inactive")
+
+    # Create JWT token
+    token = create_jwt_token(user.id, user.email)
+
+    return LoginResponse(
+        message="Login successful",
+        token=token,
+        user_id=user.id,
+        gmail_email=user.gmail_email,
+    )
 
 
 @app.post("/auth/upload-credentials", response_model=CredentialsUploadResponse)
@@ -222,7 +234,7 @@ def upload_credentials(
         
         # Validate JSON
         try:
-            creds_data = json.loads(req.credentials_json)
+            creds_data = json_loads(req.credentials_json)
         except json.JSONDecodeError:
             raise HTTPException(status_code=400, detail="Invalid JSON in credentials_json")
         
@@ -287,35 +299,47 @@ def get_emails(
     limit: int = 50,
     offset: int = 0,
     current_user: dict = Depends(get_current_user),
+    session: Session = Depends(get_db),
 ):
     """Get emails for current user."""
     user_id = current_user["user_id"]
-    session = get_session()
-    try:
-        emails = (
-            session.query(EmailMemory)
-            .filter_by(user_id=user_id)
-            .order_by(EmailMemory.id.desc())
-            .offset(offset)
-            .limit(limit)
-            .all()
+    # Only the listed fields: skips loading each email body.
+    emails = (
+        session.query(
+            EmailMemory.id,
+            EmailMemory.email_id,
+            EmailMemory.sender,
+            EmailMemory.subject,
+            EmailMemory.timestamp,
+            EmailMemory.priority_score,
+            EmailMemory.priority_label,
+            EmailMemory.next_action,
+            EmailMemory.task_status,
         )
-        return [
-            EmailSchema(
-                id=e.id,
-                email_id=e.email_id,
-                sender=e.sender,
-                subject=e.subject,
-                timestamp=e.timestamp,
-                priority_score=e.priority_score,
-                priority_label=e.priority_label,
-                next_action=e.next_action,
-                task_status=e.task_status,
-            )
+        .filter(EmailMemory.user_id == user_id)
+        .order_by(EmailMemory.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    # Rows come straight from our own columns, so they are encoded as-is
+    # rather than revalidated against EmailSchema one by one.
+    return ORJSONResponse(
+        [
+            {
+                "id": e.id,
+                "email_id": e.email_id,
+                "sender": e.sender,
+                "subject": e.subject,
+                "timestamp": e.timestamp,
+                "priority_score": e.priority_score,
+                "priority_label": e.priority_label,
+                "next_action": e.next_action,
+                "task_status": e.task_status,
+            }
             for e in emails
         ]
-    finally:
-        session.close()
+    )
 
 
 @app.get("/logs")
@@ -323,58 +347,73 @@ def get_logs(
     limit: int = 50,
     offset: int = 0,
     current_user: dict = Depends(get_current_user),
+    session: Session = Depends(get_db),
 ):
     """Get behavior logs for current user."""
     user_id = current_user["user_id"]
-    session = get_session()
-    try:
-        logs = (
-            session.query(BehaviorLog)
-            .filter_by(user_id=user_id)
-            .order_by(BehaviorLog.id.desc())
-            .offset(offset)
-            .limit(limit)
-            .all()
+    logs = (
+        session.query(
+            BehaviorLog.id,
+            BehaviorLog.email_id,
+            BehaviorLog.intent,
+            BehaviorLog.proposed_action,
+            BehaviorLog.agent_action,
+            BehaviorLog.created_at,
         )
-        return [
-            {
-                "id": l.id,
-                "email_id": l.email_id,
-                "intent": l.intent,
-                "proposed_action": l.proposed_action,
-                "agent_action": l.agent_action,
-                "created_at": l.created_at,
-            }
-            for l in logs
-        ]
-    finally:
-        session.close()
+        .filter(BehaviorLog.user_id == user_id)
+        .order_by(BehaviorLog.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "id": l.id,
+            "email_id": l.email_id,
+            "intent": l.intent,
+            "proposed_action": l.proposed_action,
+            "agent_action": l.agent_action,
+            "created_at": iso_from_ms(l.created_at),
+        }
+        for l in logs
+    ]
 
 
 @app.get("/stats")
-def get_stats(current_user: dict = Depends(get_current_user)):
+def get_stats(
+    current_user: dict = Depends(get_current_user),
+    session: Session = Depends(get_db),
+):
     """Get statistics for current user."""
     user_id = current_user["user_id"]
-    session = get_session()
-    try:
-        total_emails = session.query(EmailMemory).filter_by(user_id=user_id).count()
-        total_logs = session.query(BehaviorLog).filter_by(user_id=user_id).count()
-        pending_retries = (
-            session.query(RetryQueue)
-            .filter_by(user_id=user_id, status="pending")
-            .count()
+    # All three counts in one round-trip, each served by a user_id index.
+    total_emails, total_logs, pending_retries = session.execute(
+        select(
+            select(func.count()).select_from(EmailMemory).where(EmailMemory.user_id == user_id).scalar_subquery(),
+            select(func.count()).select_from(BehaviorLog).where(BehaviorLog.user_id == user_id).scalar_subquery(),
+            select(func.count())
+            .select_from(RetryQueue)
+            .where(RetryQueue.status == "pending", RetryQueue.user_id == user_id)
+            .scalar_subquery(),
         )
-        return {
-            "total_emails": total_emails,
-            "total_actions": total_logs,
-            "pending_retries": pending_retries,
-        }
-    finally:
-        session.close()
+    ).one()
+    return {
+        "total_emails": total_emails,
+        "total_actions": total_logs,
+        "pending_retries": pending_retries,
+        # Process-wide, shared by every user's agent cycle.
+        "llm_cache": llm_cache_stats(),
+    }
+
+
+# Mount frontend under /ui so API requests that miss a route are not looked
+# up on disk by StaticFiles.
+@app.get("/", include_in_schema=False)
+def frontend_root():
+    return RedirectResponse(url="/ui/")
 
 
-# Mount frontend
 try:
-    app.mount("/", StaticFiles(directory="web", html=True), name="static")
+    app.mount("/ui", StaticFiles(directory="web", html=True), name="static")
 except Exception as e:
     print(f"Warning: Could not mount static files: {e}")
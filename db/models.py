@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, Text, UniqueConstraint, Float, ForeignKey
+from sqlalchemy import BigInteger, Column, String, Integer, Boolean, Text, UniqueConstraint, Float, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -15,8 +15,8 @@ class User(Base):
     password_hash = Column(String(255), nullable=False)
     gmail_email = Column(String(255), nullable=False)  # Gmail account email
     is_active = Column(Boolean, nullable=False, default=True)
-    created_at = Column(String(50), nullable=False, default="")
-    updated_at = Column(String(50), nullable=False, default="")
+    created_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
+    updated_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
 
 
 class UserCredentials(Base):
@@ -29,14 +29,16 @@ class UserCredentials(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     credentials_json = Column(Text, nullable=False)  # Encrypted credentials.json content
     token_json = Column(Text, nullable=False, default="")  # Encrypted token.json content
-    created_at = Column(String(50), nullable=False, default="")
-    updated_at = Column(String(50), nullable=False, default="")
+    created_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
+    updated_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
 
 
 class EmailMemory(Base):
     __tablename__ = "email_memory"
     __table_args__ = (
         UniqueConstraint("user_id", "email_id", name="uq_email_memory_user_email"),
+        Index("ix_email_memory_sender_decision", "sender", "decision_timestamp"),
+        Index("ix_email_memory_user_id", "user_id", "id"),
     )
 
     id = Column(Integer, primary_key=True)
@@ -54,19 +56,27 @@ class EmailMemory(Base):
     priority_score = Column(Integer, nullable=False, default=0)
     priority_reasons = Column(Text, nullable=False, default="")
     priority_tier = Column(String(50), nullable=False, default="")
-    decision_timestamp = Column(String(50), nullable=False, default="")
+    decision_timestamp = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
     reply_draft = Column(Text, nullable=False, default="")
-    reply_timestamp = Column(String(50), nullable=False, default="")
+    reply_timestamp = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
     next_action = Column(String(50), nullable=False, default="")
     action_reason = Column(Text, nullable=False, default="")
     task_status = Column(String(50), nullable=False, default="")
     urgent_flag = Column(Boolean, nullable=False, default=False)
     needs_human_review = Column(Boolean, nullable=False, default=False)
-    action_timestamp = Column(String(50), nullable=False, default="")
+    action_timestamp = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
 
 
 class RetryQueue(Base):
     __tablename__ = "retry_queue"
+    __table_args__ = (
+        # pending_key is 1 while a row is pending and NULL afterwards. NULLs never
+        # collide in a unique index, so this allows one pending row per key on
+        # every dialect (MySQL has no partial indexes).
+        Index("uq_retry_queue_pending", "user_id", "email_id", "operation", "pending_key", unique=True),
+        Index("ix_retry_queue_status_user", "status", "user_id", "id"),
+        Index("ix_retry_queue_status_next", "status", "next_retry_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -74,15 +84,19 @@ class RetryQueue(Base):
     operation = Column(String(50), nullable=False, default="analyze_and_execute")
     payload = Column(Text, nullable=False, default="")
     status = Column(String(50), nullable=False, default="pending")
+    pending_key = Column(Integer, nullable=True, default=None)
     attempts = Column(Integer, nullable=False, default=0)
-    next_retry_at = Column(String(50), nullable=False, default="")
+    next_retry_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
     last_error = Column(Text, nullable=False, default="")
-    created_at = Column(String(50), nullable=False, default="")
-    updated_at = Column(String(50), nullable=False, default="")
+    created_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
+    updated_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
 
 
 class TaskQueue(Base):
     __tablename__ = "task_queue"
+    __table_args__ = (
+        UniqueConstraint("user_id", "email_id", name="uq_task_queue_user_email"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -90,14 +104,19 @@ class TaskQueue(Base):
     title = Column(String(255), nullable=False, default="")
     description = Column(Text, nullable=False, default="")
     status = Column(String(50), nullable=False, default="open")
-    created_at = Column(String(50), nullable=False, default="")
-    updated_at = Column(String(50), nullable=False, default="")
+    created_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
+    updated_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
 
 
 class BehaviorLog(Base):
     __tablename__ = "behavior_log"
     __table_args__ = (
         UniqueConstraint("user_id", "email_id", name="uq_behavior_log_user_email"),
+        Index("ix_behavior_log_domain_final", "sender_domain", "user_final_action"),
+        Index("ix_behavior_log_intent_final", "intent", "user_final_action"),
+        Index("ix_behavior_log_user_final_action", "user_final_action"),
+        Index("ix_behavior_log_email_id", "email_id"),
+        Index("ix_behavior_log_user_id", "user_id", "id"),
     )
 
     id = Column(Integer, primary_key=True)
@@ -113,5 +132,34 @@ class BehaviorLog(Base):
     llm_confidence = Column(Float, nullable=False, default=0.0)
     behavior_match_score = Column(Float, nullable=False, default=0.0)
     final_decision_score = Column(Float, nullable=False, default=0.0)
-    created_at = Column(String(50), nullable=False, default="")
-    updated_at = Column(String(50), nullable=False, default="")
+    created_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
+    updated_at = Column(BigInteger, nullable=False, default=0)  # epoch milliseconds, UTC
+
+
+class BehaviorAggSender(Base):
+    __tablename__ = "behavior_agg_sender"
+
+    sender_domain = Column(String(255), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    replies = Column(Integer, nullable=False, default=0)
+    opens = Column(Integer, nullable=False, default=0)
+    auto_total = Column(Integer, nullable=False, default=0)
+    overrides = Column(Integer, nullable=False, default=0)
+
+
+class BehaviorAggIntent(Base):
+    __tablename__ = "behavior_agg_intent"
+
+    intent = Column(String(255), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    replies = Column(Integer, nullable=False, default=0)
+    auto_total = Column(Integer, nullable=False, default=0)
+    overrides = Column(Integer, nullable=False, default=0)
+
+
+class BehaviorAggGlobal(Base):
+    __tablename__ = "behavior_agg_global"
+
+    id = Column(Integer, primary_key=True)
+    auto_total = Column(Integer, nullable=False, default=0)
+    overrides = Column(Integer, nullable=False, default=0)
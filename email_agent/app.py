@@ -1,97 +1,212 @@
 from pathlib import Path
+import os
 import sys
-import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
+from agent._db import ensure_db
+from agent._logging import configure_logging
 from agent.ingestion import ingest_emails
-from agent.observation import observe_email
-from agent.decision import analyze_email_with_status
-from agent.persist import persist_observation
-from agent.memory import store_email
-from agent.actions import execute_next_action
-from agent.behavior import log_behavior_event, sender_domain_from_observed
+from agent.observation import observe_emails
+from agent.decision import analyze_emails_batch
+from agent.persist import persist_observations
+from agent.memory import store_emails
+from agent.actions import execute_next_actions
+from agent.behavior import log_behavior_events, sender_domain_from_observed
 from agent.retry_queue import enqueue_retry, process_retry_queue
 from db.models import EmailMemory, UserCredentials, User
-from db.session import get_session, init_db
-from gmail.auth import get_credentials_for_user
+from db.session import SessionLocal
+from gmail.auth import get_credentials_for_user, get_credentials_for_users
 from googleapiclient.discovery import build
+from sqlalchemy.orm import scoped_session
 
 
 import time
 
 # ... (imports remain)
 
-# Global control flags
-should_run = False
+logger = logging.getLogger(__name__)
+
+# Users processed concurrently per tick.
+AGENT_USER_CONCURRENCY = max(1, int(os.getenv("AGENT_USER_CONCURRENCY", "8")))
+
+# Global control flags; the agent is stopped until start_agent() clears the event.
+stop_event = threading.Event()
+stop_event.set()
 is_running = False
 
+# Sessions of the agent loop and its workers, one per thread, reused across cycles.
+_cycle_session = scoped_session(SessionLocal)
+
+# Per-user (stored token, (creds, gmail service, calendar service)), kept across cycles.
+_service_cache = {}
+
+
+def _has_cached_services(user_id, token_json):
+    cached = _service_cache.get(user_id)
+    return bool(cached and cached[0] == token_json and cached[1][0].valid)
+
+
+def _services_for_user(user_id, token_json=None, creds=None):
+    """
+    Returns the user's credentials with Gmail and Calendar services, reusing
+    the ones built in an earlier cycle while their access token is valid and
+    the stored token has not changed. Credentials prefetched by the loop are
+    used instead of loading them again.
+
+    Input: user_id=1, token_json='{"token": ...}', creds=None
+    Output: (<Credentials>, <gmail service>, <calendar service>) or None
+    """
+    if _has_cached_services(user_id, token_json):
+        return _service_cache[user_id][1]
+    _service_cache.pop(user_id, None)
+    if creds is None:
+        creds = get_credentials_for_user(user_id, token_json=token_json)
+    if not creds:
+        return None
+    # The discovery documents ship with the client library; skip the file cache.
+    services = (
+        creds,
+        build("gmail", "v1", credentials=creds, cache_discovery=False),
+        build("calendar", "v3", credentials=creds, cache_discovery=False),
+    )
+    _service_cache[user_id] = (token_json, services)
+    return services
+
+def _behavior_event(observed, analysis, action_result, email_id, user_id):
+    """
+    Builds the log_behavior_event() arguments for one processed email.
+
+    Input: observed={...}, analysis={"Intent": "proposal", ...}, action_result={"Action": "draft_reply", ...}, email_id="123", user_id=1
+    Output: {"email_id": "123", "intent": "proposal", ...}
+    """
+    get_action = action_result.get
+    action = str(get_action("Action") or "")
+    return {
+        "email_id": observed.get("email_id") or observed.get("id") or email_id or "",
+        "intent": str(analysis.get("Intent") or ""),
+        "sender_domain": sender_domain_from_observed(observed),
+        "requires_reply": analysis.get("RequiresReply"),
+        "proposed_action": str(get_action("ProposedAction") or "") or action,
+        "agent_action": action,
+        "llm_confidence": float(get_action("LLMConfidence", analysis.get("Confidence", 0.0)) or 0.0),
+        "behavior_match_score": float(get_action("ImportanceScore", 0.0) or 0.0),
+        "final_decision_score": float(get_action("FinalDecisionScore", 0.0) or 0.0),
+        "user_final_action": "",
+        "user_id": user_id,
+    }
+
 def run_single_cycle(service, cal_service, session, user_id, creds):
     """
     Runs a single cycle of the email agent loop for a specific user.
     """
+    # Behavior events of the cycle are written together in one transaction,
+    # also when the cycle stops early.
+    behavior_events = []
+    # Persisted emails are skipped by later cycles, so any the cycle does not
+    # reach are queued for retry in the finally block.
+    new_emails = []
+    persisted = False
+    reached = 0
     try:
+        # Due retries are drained once per cycle; failures queued during this
+        # cycle are picked up at the start of the next one.
         process_retry_queue(service=service, cal_service=cal_service, user_id=user_id)
-        emails = ingest_emails(creds, max_results=20)
+        emails = ingest_emails(creds, max_results=20, service=service)
         
+        # One query for which fetched ids are already stored, instead of a row lookup each.
+        fetched_ids = [e.get("id") for e in emails if e.get("id")]
+        known_ids = set()
+        if fetched_ids:
+            try:
+                known_ids = {
+                    email_id
+                    for (email_id,) in session.query(EmailMemory.email_id).filter(
+                        EmailMemory.user_id == user_id,
+                        EmailMemory.email_id.in_(fetched_ids),
+                    )
+                }
+            finally:
+                # Return the connection to the pool before the Gmail and LLM
+                # calls below; later writes open their own short sessions.
+                session.close()
+
+        new_ids = []
         for e in emails:
-            if not should_run:
+            if stop_event.is_set():
                 break
 
             email_id = e.get("id")
-            if email_id and session.query(EmailMemory).filter_by(email_id=email_id, user_id=user_id).first():
+            if email_id and email_id in known_ids:
                 continue
 
-            print(f"New email detected for user {user_id}: {email_id}")
-            observed = observe_email(service, e["id"])
-            print(f"Email body: {observed.get('content', 'No content')}")
-            persist_observation(observed, user_id=user_id)
-            try:
-                store_email(observed.get("content", ""))
-            except Exception:
-                pass
+            logger.info("New email detected for user %s: %s", user_id, email_id)
+            new_ids.append(email_id)
+
+        # Fetch all new messages in batched Gmail requests instead of one call each.
+        for email_id, observed in zip(new_ids, observe_emails(service, new_ids)):
+            logger.debug("Email body: %s", observed.get("content", "No content"))
+            new_emails.append((email_id, observed))
 
-            analysis, analysis_ok = analyze_email_with_status(observed)
-            print(f"Analysis OK: {analysis_ok}")
-            print(f"Analysis result: {analysis}")
+        persist_observations([observed for _, observed in new_emails], user_id=user_id)
+        persisted = True
+        try:
+            store_emails([observed.get("content", "") for _, observed in new_emails])
+        except Exception:
+            pass
+
+        # Analyze every new email of the cycle with concurrent LLM calls, then
+        # run the actions of the analyzed ones as one batch.
+        analyses = analyze_emails_batch([observed for _, observed in new_emails])
+        ready = [i for i, (_, analysis_ok) in enumerate(analyses) if analysis_ok]
+        action_outcomes = dict(zip(ready, execute_next_actions(
+            [new_emails[i][1] for i in ready],
+            [analyses[i][0] for i in ready],
+            service=service,
+            cal_service=cal_service,
+            user_id=user_id,
+        )))
+        for i, ((email_id, observed), (analysis, analysis_ok)) in enumerate(zip(new_emails, analyses)):
+            logger.debug("Analysis OK: %s", analysis_ok)
+            logger.debug("Analysis result: %s", analysis)
             
-            if not analysis_ok:
-                # Analysis failed, queue for retry
-                print(f"Analysis failed, queuing for retry. Reason: {analysis.get('Reasoning', '')}")
-                enqueue_retry(observed, operation="analyze_and_execute", error=str(analysis.get("Reasoning", "")), user_id=user_id)
+            try:
+                if not analysis_ok:
+                    # Analysis failed, queue for retry
+                    logger.warning("Analysis failed, queuing for retry. Reason: %s", analysis.get("Reasoning", ""))
+                    enqueue_retry(observed, operation="analyze_and_execute", error=str(analysis.get("Reasoning", "")), user_id=user_id)
+                    action_result = {
+                        "Action": "queued_for_retry",
+                        "ActionReason": "Analysis failed and was queued for retry.",
+                        "Draft": {"DraftReply": "", "Reasoning": "No draft generated.", "Confidence": 0.0},
+                    }
+                else:
+                    # Analysis succeeded; its action ran in the batch above
+                    action_result, action_ok, action_error = action_outcomes[i]
+                    logger.debug("Action execution OK: %s", action_ok)
+                    logger.debug("Action result: %s", action_result)
+                    if not action_ok:
+                        logger.warning("Action failed, queuing for retry. Error: %s", action_error)
+                        enqueue_retry(observed, operation="analyze_and_execute", error=action_error, user_id=user_id)
+                    else:
+                        logger.info("Action executed successfully: %s", action_result.get("Action"))
+            except Exception as e:
+                # One email's failure must not cost the rest of the cycle.
+                logger.error("Processing email %s failed, queuing for retry: %s", email_id, e)
+                enqueue_retry(observed, operation="analyze_and_execute", error=f"processing failed: {e.__class__.__name__}", user_id=user_id)
                 action_result = {
                     "Action": "queued_for_retry",
-                    "ActionReason": "Analysis failed and was queued for retry.",
+                    "ActionReason": "Processing failed and was queued for retry.",
                     "Draft": {"DraftReply": "", "Reasoning": "No draft generated.", "Confidence": 0.0},
                 }
-            else:
-                # Analysis succeeded, try to execute the action
-                action_result, action_ok, action_error = execute_next_action(observed, analysis, service=service, cal_service=cal_service, user_id=user_id)
-                print(f"Action execution OK: {action_ok}")
-                print(f"Action result: {action_result}")
-                if not action_ok:
-                    print(f"Action failed, queuing for retry. Error: {action_error}")
-                    enqueue_retry(observed, operation="analyze_and_execute", error=action_error, user_id=user_id)
-                else:
-                    print(f"Action executed successfully: {action_result.get('Action')}")
-
-            log_behavior_event(
-                email_id=observed.get("email_id") or observed.get("id") or email_id or "",
-                intent=str(analysis.get("Intent") or ""),
-                sender_domain=sender_domain_from_observed(observed),
-                requires_reply=analysis.get("RequiresReply"),
-                proposed_action=str(action_result.get("ProposedAction") or action_result.get("Action") or ""),
-                agent_action=str(action_result.get("Action") or ""),
-                llm_confidence=float(action_result.get("LLMConfidence", analysis.get("Confidence", 0.0)) or 0.0),
-                behavior_match_score=float(action_result.get("ImportanceScore", 0.0) or 0.0),
-                final_decision_score=float(action_result.get("FinalDecisionScore", 0.0) or 0.0),
-                user_final_action="",
-                user_id=user_id,
-            )
-
-            process_retry_queue(service=service, cal_service=cal_service, limit=1, user_id=user_id)
+            reached += 1
+
+            behavior_events.append(_behavior_event(observed, analysis, action_result, email_id, user_id))
 
             output = {
                 "EmailId": observed.get("email_id") or observed.get("id") or email_id or "",
@@ -101,90 +216,125 @@ def run_single_cycle(service, cal_service, session, user_id, creds):
                 "CalendarEvent": action_result.get("CalendarEvent"),
                 "Draft": action_result.get("Draft"),
             }
-            # print(json.dumps(output, ensure_ascii=True)) # Suppress print in background
             yield output
 
     except Exception as e:
-        print(f"Error in agent loop for user {user_id}: {e}")
+        logger.error("Error in agent loop for user %s: %s", user_id, e)
+    finally:
+        if persisted:
+            for email_id, observed in new_emails[reached:]:
+                try:
+                    enqueue_retry(observed, operation="analyze_and_execute", error="cycle ended before processing", user_id=user_id)
+                except Exception as e:
+                    logger.error("Could not queue email %s of user %s for retry: %s", email_id, user_id, e)
+        try:
+            log_behavior_events(behavior_events)
+        except Exception as e:
+            logger.error("Could not log behavior events for user %s: %s", user_id, e)
+
+def _end_cycle(session):
+    # Ends the cycle's transaction so its connection goes back to the pool;
+    # the session itself stays with the thread for its next cycle.
+    try:
+        session.commit()
+    except Exception:
+        session.rollback()
+    # Sessions do not expire on commit; drop what this cycle loaded.
+    session.expire_all()
+
+def _process_user(user_id, user_email, token_json=None, creds=None):
+    """
+    Runs one agent cycle for a user with the worker thread's session.
+
+    Input: user_id=1, user_email="user@example.com", token_json='{"token": ...}', creds=None
+    Output: None
+    """
+    if stop_event.is_set():
+        return
+    try:
+        services = _services_for_user(user_id, token_json, creds)
+        if not services:
+            logger.warning("Could not load credentials for user %s (%s), skipping...", user_id, user_email)
+            return
+        creds, service, cal_service = services
+
+        # Process this user's emails
+        session = _cycle_session()
+        try:
+            for _ in run_single_cycle(service, cal_service, session, user_id, creds):
+                pass
+        finally:
+            _end_cycle(session)
+
+    except Exception as e:
+        logger.error("Error processing user %s: %s", user_id, e)
 
 def run_agent_loop():
     """
     Main loop for the email agent. Monitors inboxes for all users with stored credentials,
     analyzes emails, and takes actions.
     """
-    global should_run, is_running
+    global is_running
     
-    init_db()
-    print("Agent background task started.")
+    ensure_db()
+    logger.info("Agent background task started.")
     is_running = True
     
-    while should_run:
+    # Users' cycles are independent and mostly wait on Gmail and the LLM, so
+    # they run side by side. The workers live as long as the loop, and each
+    # keeps its session from one cycle to the next.
+    pool = ThreadPoolExecutor(max_workers=AGENT_USER_CONCURRENCY)
+    while not stop_event.is_set():
         try:
             # Get all users with stored credentials
-            session = get_session()
+            session = _cycle_session()
             try:
+                # The stored token comes along so credentials need no query per user.
                 users_with_creds = (
-                    session.query(User.id, User.email)
+                    session.query(User.id, User.email, UserCredentials.token_json)
                     .join(UserCredentials, User.id == UserCredentials.user_id)
                     .all()
                 )
             finally:
-                session.close()
+                _end_cycle(session)
             
-            # Process each user's emails
-            for user_id, user_email in users_with_creds:
-                if not should_run:
-                    break
-                
-                try:
-                    # Get credentials for this user from database
-                    creds = get_credentials_for_user(user_id)
-                    if not creds:
-                        print(f"Could not load credentials for user {user_id} ({user_email}), skipping...")
-                        continue
-                    
-                    # Build services
-                    service = build("gmail", "v1", credentials=creds)
-                    cal_service = build("calendar", "v3", credentials=creds)
-                    
-                    # Process this user's emails
-                    session = get_session()
-                    try:
-                        for _ in run_single_cycle(service, cal_service, session, user_id, creds):
-                            pass
-                    finally:
-                        session.close()
-                        
-                except Exception as e:
-                    print(f"Error processing user {user_id}: {e}")
-                    continue
+            # Users without usable cached services get their credentials in
+            # one query, with expired tokens refreshed concurrently.
+            prefetched = get_credentials_for_users([
+                user_id
+                for user_id, _, token_json in users_with_creds
+                if not _has_cached_services(user_id, token_json)
+            ])
+
+            list(pool.map(
+                lambda user: _process_user(*user, creds=prefetched.get(user[0])),
+                users_with_creds,
+            ))
         
         except Exception as e:
-            print(f"Error in agent main loop: {e}")
+            logger.error("Error in agent main loop: %s", e)
         
-        # Sleep with check
-        for _ in range(30):
-            if not should_run:
-                break
-            time.sleep(1)
+        # Wait for the next tick; stop_agent() ends the wait at once.
+        if stop_event.wait(30.0):
+            break
 
+    pool.shutdown(wait=True)
+    _cycle_session.remove()
     is_running = False
-    print("Agent background task stopped.")
+    logger.info("Agent background task stopped.")
 
 
 def start_agent():
-    global should_run
-    if not should_run:
-        should_run = True
-        import threading
+    if stop_event.is_set():
+        stop_event.clear()
         t = threading.Thread(target=run_agent_loop)
         t.start()
 
 def stop_agent():
-    global should_run
-    should_run = False
+    stop_event.set()
 
 if __name__ == "__main__":
+    configure_logging()
     start_agent()
     while True:
         try:
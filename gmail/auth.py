@@ -5,7 +5,10 @@ import os
 import sys
 import httplib2
 import certifi
-import json
+from agent._jsonutils import json_loads
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
 from typing import Optional
 
 SCOPES = [
@@ -15,19 +18,47 @@ SCOPES = [
 ]
 
 
+# CA bundles to try, in order; the paths do not change while the process runs.
+_CA_CANDIDATES = (
+    Path(certifi.where()),
+    Path(sys.base_prefix) / "Lib" / "site-packages" / "certifi" / "cacert.pem",
+)
+_CA_CONFIGURED = False
+
+# Token endpoint round-trips run in parallel when many users are loaded at once.
+CREDS_REFRESH_CONCURRENCY = max(1, int(os.getenv("CREDS_REFRESH_CONCURRENCY", "16")))
+
+_ROOT_DIR = Path(__file__).resolve().parents[1]
+_TOKEN_PATH = _ROOT_DIR / "token.json"
+
+
+@cache
+def _client_secrets_path() -> Path:
+    """
+    Resolves the OAuth client secrets file once; only read when token.json is missing.
+    """
+    creds_path = _ROOT_DIR / "credentials.json"
+    alt_creds_path = _ROOT_DIR / "email_agent" / "credentials.json"
+    if not creds_path.exists() and alt_creds_path.exists():
+        return alt_creds_path
+    return creds_path
+
+
 def _configure_ssl_ca(root_dir: Path) -> None:
     """
     Ensure Google API HTTP client uses a valid CA bundle.
+    The filesystem is only probed on the first call.
     """
+    global _CA_CONFIGURED
+    if _CA_CONFIGURED:
+        return
+    _CA_CONFIGURED = True
+
     current = getattr(httplib2, "CA_CERTS", "") or ""
     if current and Path(current).exists():
         return
 
-    candidates = [
-        Path(certifi.where()),
-        Path(sys.base_prefix) / "Lib" / "site-packages" / "certifi" / "cacert.pem",
-    ]
-    for path in candidates:
+    for path in _CA_CANDIDATES:
         if path.exists():
             ca_path = str(path)
             httplib2.CA_CERTS = ca_path
@@ -43,68 +74,217 @@ def get_credentials():
     Input: None
     Output: <Credentials object>
     """
-    root_dir = Path(__file__).resolve().parents[1]
-    _configure_ssl_ca(root_dir)
-    token_path = root_dir / "token.json"
-    creds_path = root_dir / "credentials.json"
-    alt_creds_path = root_dir / "email_agent" / "credentials.json"
-
-    if not creds_path.exists() and alt_creds_path.exists():
-        creds_path = alt_creds_path
+    _configure_ssl_ca(_ROOT_DIR)
 
-    if token_path.exists():
-        return Credentials.from_authorized_user_file(str(token_path), SCOPES)
+    # Open token.json directly rather than stat-ing it first.
+    try:
+        return Credentials.from_authorized_user_file(str(_TOKEN_PATH), SCOPES)
+    except FileNotFoundError:
+        pass
 
-    flow = InstalledAppFlow.from_client_secrets_file(str(creds_path), SCOPES)
+    flow = InstalledAppFlow.from_client_secrets_file(str(_client_secrets_path()), SCOPES)
     creds = flow.run_local_server(port=0)
 
-    token_path.write_text(creds.to_json(), encoding="utf-8")
+    _TOKEN_PATH.write_text(creds.to_json(), encoding="utf-8")
 
     return creds
 
 
-def get_credentials_for_user(user_id: int) -> Optional[Credentials]:
+# user_id -> (token_json the credentials were parsed from, Credentials).
+_CREDS_CACHE = {}
+_creds_lock = threading.RLock()
+
+
+def invalidate_user_creds(user_id: int) -> None:
+    """
+    Drops the cached credentials of a user, e.g. after new ones were stored.
+
+    Input: user_id (int)
+    Output: None
+    """
+    with _creds_lock:
+        _CREDS_CACHE.pop(user_id, None)
+
+
+def _cache_creds(user_id: int, token_json: str, creds: Credentials) -> Credentials:
+    with _creds_lock:
+        _CREDS_CACHE[user_id] = (token_json, creds)
+    return creds
+
+
+def _refresh_cached_creds(user_id: int, creds: Credentials) -> Optional[Credentials]:
+    """
+    Refreshes expired cached credentials and stores the new token with a
+    single UPDATE. Returns None when the refresh fails.
+    """
+    from google.auth.transport.requests import Request
+    from sqlalchemy import update
+    from agent._timeutils import now_ms
+    from db.session import engine
+    from db.models import UserCredentials
+
+    try:
+        creds.refresh(Request())
+    except Exception:
+        invalidate_user_creds(user_id)
+        return None
+    token_json = creds.to_json()
+    with engine.begin() as conn:
+        conn.execute(
+            update(UserCredentials)
+            .where(UserCredentials.user_id == user_id)
+            .values(token_json=token_json, updated_at=now_ms())
+        )
+    return _cache_creds(user_id, token_json, creds)
+
+
+def get_credentials_for_user(user_id: int, token_json: Optional[str] = None) -> Optional[Credentials]:
     """
     Retrieves Google API credentials for a specific user from the database.
+    A token_json already read by the caller is used without querying again.
+    Parsed credentials are cached per user; expired ones are refreshed and
+    written back instead of being read again.
     
-    Input: user_id (int)
+    Input: user_id (int), token_json (str, optional)
     Output: <Credentials object> or None
     """
     try:
-        from db.session import get_session
+        with _creds_lock:
+            cached = _CREDS_CACHE.get(user_id)
+        if cached and (token_json is None or token_json == cached[0]):
+            creds = cached[1]
+            if creds.valid:
+                return creds
+            if creds.expired and creds.refresh_token:
+                refreshed = _refresh_cached_creds(user_id, creds)
+                if refreshed is not None:
+                    return refreshed
+
+        if token_json:
+            creds = Credentials.from_authorized_user_info(json_loads(token_json), SCOPES)
+            return _cache_creds(user_id, token_json, creds)
+
+        from db.session import SessionLocal
         from db.models import UserCredentials
+        from sqlalchemy import select, update
         
-        session = get_session()
-        try:
-            user_cred = session.query(UserCredentials).filter_by(user_id=user_id).first()
-            if not user_cred:
+        # Plain column reads: no ORM entity is built for a lookup.
+        with SessionLocal() as session:
+            row = session.execute(
+                select(UserCredentials.token_json).where(UserCredentials.user_id == user_id)
+            ).first()
+            if row is None:
                 return None
             
             # If we have a token, use it
-            if user_cred.token_json:
-                token_data = json.loads(user_cred.token_json)
+            if row.token_json:
+                token_data = json_loads(row.token_json)
                 creds = Credentials.from_authorized_user_info(token_data, SCOPES)
-                return creds
+                return _cache_creds(user_id, row.token_json, creds)
             
             # Otherwise, create new credentials from credentials_json
-            if user_cred.credentials_json:
-                creds_data = json.loads(user_cred.credentials_json)
+            credentials_json = session.execute(
+                select(UserCredentials.credentials_json).where(UserCredentials.user_id == user_id)
+            ).scalar()
+            if credentials_json:
+                creds_data = json_loads(credentials_json)
                 flow = InstalledAppFlow.from_client_config(creds_data, SCOPES)
                 creds = flow.run_local_server(port=0)
                 
-                # Save token back to database
-                token_data = json.loads(creds.to_json())
-                user_cred.token_json = json.dumps(token_data)
+                # Save token back to database; to_json() is already the stored form
+                token_json = creds.to_json()
+                session.execute(
+                    update(UserCredentials)
+                    .where(UserCredentials.user_id == user_id)
+                    .values(token_json=token_json)
+                )
                 session.commit()
                 
-                return creds
-        finally:
-            session.close()
+                return _cache_creds(user_id, token_json, creds)
     except Exception as e:
         print(f"Error retrieving credentials for user {user_id}: {e}")
         return None
 
 
+def get_credentials_for_users(user_ids: list[int]) -> dict[int, Credentials]:
+    """
+    Loads credentials for many users with one query, refreshing expired
+    tokens concurrently and writing them back in a single executemany UPDATE.
+    Users without a stored token or whose refresh fails are left out.
+
+    Input: user_ids=[1, 2, 3]
+    Output: {1: <Credentials object>, 3: <Credentials object>}
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    try:
+        from google.auth.transport.requests import Request
+        from sqlalchemy import bindparam, select, update
+        from agent._timeutils import now_ms
+        from db.session import SessionLocal, engine
+        from db.models import UserCredentials
+
+        with SessionLocal() as session:
+            rows = session.execute(
+                select(UserCredentials.user_id, UserCredentials.token_json)
+                .where(UserCredentials.user_id.in_(user_ids))
+            ).all()
+
+        loaded = {}
+        for user_id, token_json in rows:
+            if not token_json:
+                continue
+            with _creds_lock:
+                cached = _CREDS_CACHE.get(user_id)
+            if cached and cached[0] == token_json:
+                loaded[user_id] = cached[1]
+            else:
+                creds = Credentials.from_authorized_user_info(json_loads(token_json), SCOPES)
+                loaded[user_id] = _cache_creds(user_id, token_json, creds)
+
+        stale = [
+            user_id for user_id, creds in loaded.items()
+            if not creds.valid and creds.expired and creds.refresh_token
+        ]
+
+        def _refresh(user_id):
+            try:
+                loaded[user_id].refresh(Request())
+                return True
+            except Exception:
+                return False
+
+        refreshed = []
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(CREDS_REFRESH_CONCURRENCY, len(stale))) as pool:
+                for user_id, ok in zip(stale, pool.map(_refresh, stale)):
+                    if ok:
+                        refreshed.append(user_id)
+                    else:
+                        invalidate_user_creds(user_id)
+                        del loaded[user_id]
+
+        if refreshed:
+            now = now_ms()
+            params = []
+            for user_id in refreshed:
+                token_json = loaded[user_id].to_json()
+                _cache_creds(user_id, token_json, loaded[user_id])
+                params.append({"uid": user_id, "token": token_json})
+            with engine.begin() as conn:
+                conn.execute(
+                    update(UserCredentials)
+                    .where(UserCredentials.user_id == bindparam("uid"))
+                    .values(token_json=bindparam("token"), updated_at=now),
+                    params,
+                )
+        return loaded
+    except Exception as e:
+        print(f"Error retrieving credentials for users {user_ids}: {e}")
+        return {}
+
+
 def store_credentials_for_user(user_id: int, credentials_json: str, token_json: str = "") -> bool:
     """
     Stores or updates Google API credentials for a user in the database.
@@ -113,37 +293,32 @@ def store_credentials_for_user(user_id: int, credentials_json: str, token_json:
     Output: bool (success/failure)
     """
     try:
-        from db.session import get_session
+        from agent._db import upsert
+        from agent._timeutils import now_ms
+        from db.session import SessionLocal
         from db.models import UserCredentials
-        from datetime import datetime, timezone
         
-        session = get_session()
-        try:
-            user_cred = session.query(UserCredentials).filter_by(user_id=user_id).first()
-            now = datetime.now(tz=timezone.utc).isoformat()
-            
-            if user_cred:
-                user_cred.credentials_json = credentials_json
-                if token_json:
-                    user_cred.token_json = token_json
-                user_cred.updated_at = now
-            else:
-                user_cred = UserCredentials(
-                    user_id=user_id,
-                    credentials_json=credentials_json,
-                    token_json=token_json or "",
-                    created_at=now,
-                    updated_at=now,
-                )
-            
-            session.add(user_cred)
-            session.commit()
-            return True
-        finally:
-            session.close()
+        now = now_ms()
+        update_values = {"credentials_json": credentials_json, "updated_at": now}
+        if token_json:
+            update_values["token_json"] = token_json
+        # One statement whether or not the user already has credentials.
+        with SessionLocal() as session, session.begin():
+            upsert(
+                session,
+                UserCredentials,
+                {
+                    "user_id": user_id,
+                    "credentials_json": credentials_json,
+                    "token_json": token_json or "",
+                    "created_at": now,
+                    "updated_at": now,
+                },
+                ("user_id",),
+                update_values,
+            )
+        invalidate_user_creds(user_id)
+        return True
     except Exception as e:
         print(f"Error storing credentials for user {user_id}: {e}")
         return False
-
-
-    return creds
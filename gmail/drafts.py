@@ -1,46 +1,148 @@
 import base64
+import re
+from concurrent.futures import ThreadPoolExecutor
 from email.message import EmailMessage
 
-def create_gmail_draft(service, msg_metadata, draft_text):
+# Gmail accepts up to 100 calls per batch request.
+DRAFT_BATCH_SIZE = 100
+# Header values that need RFC 2047 encoding or could inject extra headers.
+_UNSAFE_HEADER_RE = re.compile(r"[^\x20-\x7e]")
+# Control characters other than tab/newline, or a line over RFC 5322's 998 octets.
+_UNSAFE_BODY_RE = re.compile(r"[\x00-\x08\x0b-\x1f\x7f]|[^\n]{999}")
+
+
+def _build_raw(recipient, subject, message_id, body):
     """
-    Creates a draft in Gmail as a reply to an existing message.
+    Hand-formats the RFC 5322 bytes of a plain-text reply, or returns None when
+    a value needs encoding that only EmailMessage provides.
 
-    Input: service=<Gmail service>, msg_metadata={"from": "...", "thread_id": "..."}, draft_text="Hello..."
-    Output: <Draft object>
+    Input: recipient="bob@example.com", subject="Re: Lunch", message_id="<abc@mail>", body="Sounds good"
+    Output: b"To: bob@example.com\r\nSubject: Re: Lunch\r\n..."
     """
-    try:
+    headers = [("To", recipient), ("Subject", subject)]
+    if message_id:
+        headers += [("In-Reply-To", message_id), ("References", message_id)]
+    lines = []
+    for name, value in headers:
+        if value is None:
+            continue
+        if not isinstance(value, str) or len(value) > 900 or _UNSAFE_HEADER_RE.search(value):
+            return None
+        lines.append(f"{name}: {value}\r\n")
+    body = body.replace("\r\n", "\n").replace("\r", "\n")
+    if _UNSAFE_BODY_RE.search(body):
+        return None
+    if not body.endswith("\n"):
+        body += "\n"
+    lines.append(
+        "MIME-Version: 1.0\r\n"
+        "Content-Type: text/plain; charset=\"utf-8\"\r\n"
+        "Content-Transfer-Encoding: 8bit\r\n\r\n"
+    )
+    lines.append(body.replace("\n", "\r\n"))
+    return "".join(lines).encode("utf-8")
+
+
+def _draft_body(msg_metadata, draft_text):
+    """
+    Builds the drafts.create request body for a reply to an existing message.
+
+    Input: msg_metadata={"from": "...", "thread_id": "..."}, draft_text="Hello..."
+    Output: {"message": {"raw": "...", "threadId": "..."}}
+    """
+    # Basic metadata
+    recipient = msg_metadata.get("from")
+    subject = msg_metadata.get("subject")
+    if subject and not subject.lower().startswith("re:"):
+        subject = f"Re: {subject}"
+
+    # Threading metadata
+    thread_id = msg_metadata.get("thread_id")
+    message_id = msg_metadata.get("message_id") # To be added in observation.py
+
+    raw = _build_raw(recipient, subject, message_id, draft_text)
+    if raw is None:
         message = EmailMessage()
         message.set_content(draft_text)
-
-        # Basic metadata
-        recipient = msg_metadata.get("from")
-        subject = msg_metadata.get("subject")
-        if subject and not subject.lower().startswith("re:"):
-            subject = f"Re: {subject}"
-        
         message["To"] = recipient
         message["Subject"] = subject
-
-        # Threading metadata
-        thread_id = msg_metadata.get("thread_id")
-        message_id = msg_metadata.get("message_id") # To be added in observation.py
-        
         if message_id:
             message["In-Reply-To"] = message_id
             message["References"] = message_id
+        raw = bytes(message)
 
-        # Encode the message
-        encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+    # Encode the message
+    encoded_message = base64.urlsafe_b64encode(raw).decode("ascii")
 
-        create_message = {
-            "message": {
-                "raw": encoded_message,
-                "threadId": thread_id
-            }
+    return {
+        "message": {
+            "raw": encoded_message,
+            "threadId": thread_id
         }
+    }
 
+def create_gmail_draft(service, msg_metadata, draft_text):
+    """
+    Creates a draft in Gmail as a reply to an existing message.
+
+    Input: service=<Gmail service>, msg_metadata={"from": "...", "thread_id": "..."}, draft_text="Hello..."
+    Output: <Draft object>
+    """
+    try:
+        create_message = _draft_body(msg_metadata, draft_text)
         draft = service.users().drafts().create(userId="me", body=create_message).execute()
         return draft
     except Exception as e:
         print(f"Error creating draft: {e}")
         return None
+
+def create_gmail_drafts_batch(service, draft_specs):
+    """
+    Creates several reply drafts through Gmail batch requests, one HTTP
+    round-trip per DRAFT_BATCH_SIZE drafts. Results keep the order of
+    draft_specs. Drafts whose batched call reported an error are retried
+    individually; when a whole batch request fails, its drafts that got no
+    response are left as None rather than risk creating them twice.
+
+    Input: service=<Gmail service>, draft_specs=[({"from": "...", "thread_id": "..."}, "Hello..."), ...]
+    Output: [<Draft object> or None, ...]
+    """
+    draft_specs = list(draft_specs)
+    drafts = [None] * len(draft_specs)
+    failed = []
+    if len(draft_specs) == 1:
+        return [create_gmail_draft(service, *draft_specs[0])]
+
+    def _collect(request_id, response, exception):
+        if exception is None:
+            drafts[int(request_id)] = response
+        else:
+            failed.append(int(request_id))
+
+    def _bodies(start):
+        bodies = []
+        for i in range(start, min(start + DRAFT_BATCH_SIZE, len(draft_specs))):
+            try:
+                bodies.append((i, _draft_body(*draft_specs[i])))
+            except Exception as e:
+                print(f"Error creating draft: {e}")
+        return bodies
+
+    # Encode the next chunk on a worker while the current batch is in flight.
+    with ThreadPoolExecutor(max_workers=1) as encoder:
+        pending = encoder.submit(_bodies, 0)
+        for start in range(0, len(draft_specs), DRAFT_BATCH_SIZE):
+            bodies = pending.result()
+            if start + DRAFT_BATCH_SIZE < len(draft_specs):
+                pending = encoder.submit(_bodies, start + DRAFT_BATCH_SIZE)
+            batch = service.new_batch_http_request(callback=_collect)
+            for i, body in bodies:
+                batch.add(service.users().drafts().create(userId="me", body=body), request_id=str(i))
+            try:
+                batch.execute()
+            except Exception as e:
+                print(f"Error creating drafts batch: {e}")
+
+    for i in failed:
+        drafts[i] = create_gmail_draft(service, *draft_specs[i])
+    return drafts
@@ -1,16 +1,50 @@
+import threading
+from collections import OrderedDict
+
 from googleapiclient.discovery import build
 
+# Services built for callers that pass only credentials, most recent last.
+# Entries hold their credentials so an id() key cannot be reused while cached.
+_SERVICE_CACHE_MAX = 32
+_service_cache = OrderedDict()
+_service_lock = threading.Lock()
+
+
+def _service_for(creds):
+    """
+    Returns a Gmail service for creds, building it only on first use.
+
+    Input: creds=<Credentials>
+    Output: <gmail service>
+    """
+    key = id(creds)
+    with _service_lock:
+        cached = _service_cache.get(key)
+        if cached is not None and cached[0] is creds:
+            _service_cache.move_to_end(key)
+            return cached[1]
+    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    with _service_lock:
+        _service_cache[key] = (creds, service)
+        _service_cache.move_to_end(key)
+        while len(_service_cache) > _SERVICE_CACHE_MAX:
+            _service_cache.popitem(last=False)
+    return service
+
 
-def fetch_emails(creds, max_results=None, page_size=500):
+def fetch_emails(creds, max_results=None, page_size=500, service=None):
     """
     Fetches a list of emails from the user's inbox.
+    Pass an existing Gmail service to reuse its authorized HTTP connection.
 
-    Input: creds=<Credentials>, max_results=100
+    Input: creds=<Credentials>, max_results=100, service=None
     Output: [{"id": "123", "threadId": "456"}, ...]
     """
-    service = build("gmail", "v1", credentials=creds)
+    if service is None:
+        service = _service_for(creds)
 
     messages = []
+    extend = messages.extend
     page_token = None
     remaining = max_results
 
@@ -27,9 +61,11 @@ def fetch_emails(creds, max_results=None, page_size=500):
             q="-from:me -in:drafts",
             maxResults=batch_size,
             pageToken=page_token,
+            # Partial response: only what callers read from the listing.
+            fields="messages(id,threadId),nextPageToken",
         ).execute()
 
-        messages.extend(results.get("messages", []) or [])
+        extend(results.get("messages") or ())
         page_token = results.get("nextPageToken")
 
         if remaining is not None:
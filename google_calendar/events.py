@@ -1,11 +1,20 @@
+import logging
+import re
 from datetime import date, datetime, timedelta, timezone
 
+_DATE_ONLY_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_RELATIVE_DAYS = {"today": 0, "tomorrow": 1, "yesterday": -1}
+_RELATIVE_DAY_RE = re.compile("|".join(_RELATIVE_DAYS))
+
+logger = logging.getLogger(__name__)
+
 
 def _normalize_event_time(value):
     """
     Normalizes a user/model-provided time into a Google Calendar-compatible value.
 
-    Returns: ("dateTime", "<ISO datetime>") or ("date", "YYYY-MM-DD"), otherwise None.
+    Returns: ("dateTime", "<ISO datetime>", <datetime>) or ("date", "YYYY-MM-DD", <date>),
+    otherwise None.
     """
     if value is None:
         return None
@@ -13,54 +22,52 @@ def _normalize_event_time(value):
     if isinstance(value, datetime):
         if value.tzinfo is None:
             value = value.replace(tzinfo=timezone.utc)
-        return ("dateTime", value.isoformat())
+        return ("dateTime", value.isoformat(), value)
 
     if isinstance(value, date):
-        return ("date", value.isoformat())
+        return ("date", value.isoformat(), value)
 
     text = str(value).strip()
     if not text:
         return None
 
-    lowered = text.lower()
-    today = datetime.now(tz=timezone.utc).date()
-    if "today" in lowered:
-        return ("date", today.isoformat())
-    if "tomorrow" in lowered:
-        return ("date", (today + timedelta(days=1)).isoformat())
-    if "yesterday" in lowered:
-        return ("date", (today - timedelta(days=1)).isoformat())
-
-    # Date-only input (YYYY-MM-DD)
-    try:
-        parsed_date = date.fromisoformat(text)
-        return ("date", parsed_date.isoformat())
-    except Exception:
-        pass
+    # One scan for the relative day words; the first one mentioned wins.
+    relative = _RELATIVE_DAY_RE.search(text.lower())
+    if relative:
+        today = datetime.now(tz=timezone.utc).date()
+        day = today + timedelta(days=_RELATIVE_DAYS[relative.group()])
+        return ("date", day.isoformat(), day)
+
+    # Date-only input (YYYY-MM-DD); anything longer goes straight to the
+    # datetime parser instead of failing date parsing first.
+    if _DATE_ONLY_RE.fullmatch(text):
+        try:
+            parsed_date = date.fromisoformat(text)
+            return ("date", parsed_date.isoformat(), parsed_date)
+        except ValueError:
+            return None
 
     # Datetime input (ISO 8601)
     try:
         parsed_dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
         if parsed_dt.tzinfo is None:
             parsed_dt = parsed_dt.replace(tzinfo=timezone.utc)
-        return ("dateTime", parsed_dt.isoformat())
+        return ("dateTime", parsed_dt.isoformat(), parsed_dt)
     except Exception:
         return None
 
 
-def _compute_end_time(start_kind, start_value, provided_end):
+def _compute_end_time(start_kind, start_obj, provided_end):
     normalized_end = _normalize_event_time(provided_end)
     if normalized_end:
-        end_kind, end_value = normalized_end
+        end_kind, end_value, _ = normalized_end
         if start_kind == end_kind:
             return end_kind, end_value
 
+    # start_obj is the date/datetime _normalize_event_time already parsed.
     if start_kind == "date":
-        start_date = date.fromisoformat(start_value)
-        return "date", (start_date + timedelta(days=1)).isoformat()
-
-    start_dt = datetime.fromisoformat(start_value.replace("Z", "+00:00"))
-    return "dateTime", (start_dt + timedelta(hours=1)).isoformat()
+        return "date", (start_obj + timedelta(days=1)).isoformat()
+    return "dateTime", (start_obj + timedelta(hours=1)).isoformat()
 
 def create_calendar_event(service, event_details):
     """
@@ -76,18 +83,18 @@ def create_calendar_event(service, event_details):
         location = event_details.get("location", "")
 
         if not start_time:
-            print("Error: start_time is required for calendar events.")
+            logger.error("start_time is required for calendar events")
             return None
 
         normalized_start = _normalize_event_time(start_time)
         if not normalized_start:
-            print(f"Error: invalid start_time for calendar event: {start_time!r}")
+            logger.error("invalid start_time for calendar event: %r", start_time)
             return None
 
-        start_kind, normalized_start_value = normalized_start
+        start_kind, normalized_start_value, start_obj = normalized_start
         end_kind, normalized_end_value = _compute_end_time(
             start_kind,
-            normalized_start_value,
+            start_obj,
             event_details.get("end_time"),
         )
 
@@ -112,12 +119,10 @@ def create_calendar_event(service, event_details):
         if attendees:
             event['attendees'] = [{'email': email} for email in attendees]
 
-        print(f"DEBUG: Creating calendar event with payload: {event}")
+        logger.debug("Creating calendar event with payload: %s", event)
         created_event = service.events().insert(calendarId='primary', body=event).execute()
-        print(f"DEBUG: Successfully created event ID: {created_event.get('id')}")
+        logger.debug("Created calendar event %s", created_event.get('id'))
         return created_event
-    except Exception as e:
-        print(f"ERROR creating calendar event: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("creating calendar event")
         return None